@@ -0,0 +1,82 @@
+"""
+Micro-benchmark of Neopixel.set_pixel() on CPython, on the rp2 stand-in of the simulator. Compares the working tree to
+the Neopixel of an earlier git revision (see git log -- src/wclock/neopixel.py for the revisions to pick from):
+
+    python sim/bench_neopixel.py --rev <revision> [--after <revision>] [--calls 100000]
+"""
+import argparse
+import subprocess
+import sys
+import time
+import types
+
+import simulator
+
+
+def _revision(rev: str):
+    """
+    Neopixel of src/wclock/neopixel.py at git revision <rev>.
+    """
+    source = subprocess.run(["git", "show", f"{rev}:src/wclock/neopixel.py"], cwd=simulator.ROOT_DIR, check=True,
+                            capture_output=True, text=True).stdout
+    module = types.ModuleType(f"neopixel_{rev}")
+    # its metrics go to a registry of their own, the names are taken by the working tree
+    import metrics
+    registry = metrics.REGISTRY
+    metrics.REGISTRY = metrics.Registry()
+    try:
+        exec(compile(source, f"{rev}:src/wclock/neopixel.py", "exec"), module.__dict__)
+    finally:
+        metrics.REGISTRY = registry
+    return module.Neopixel
+
+
+def _seconds(f, calls: int) -> float:
+    start = time.perf_counter()
+    for i in range(calls):
+        f(i)
+    return time.perf_counter() - start
+
+
+def cases(neopixel) -> dict:
+    """
+    Calls measured on a strip of <neopixel>: name -> (f(i), number of calls relative to --calls).
+    """
+    strip = neopixel(11 * 11, 1, 22, "GRB")
+    strip.brightness(100)
+    colors = [(255, 0, 0), (0, 255, 0), (0, 0, 255), (255, 100, 0)]
+    return {
+        "set_pixel": (lambda i: strip.set_pixel(i % 121, colors[i & 3]), 1),
+        "set_pixel how_bright": (lambda i: strip.set_pixel(i % 121, colors[i & 3], 50 + (i & 7)), 1),
+        "fill": (lambda i: strip.fill(colors[i & 3]), 0.01),
+    }
+
+
+def bench(before: dict, after: dict, calls: int, repeat: int) -> None:
+    for name in after:
+        # alternate the two, so both see the same state of the host, and keep the best run of each
+        best = [None, None]
+        for r in range(repeat):
+            for k, (f, share) in enumerate((before[name], after[name])):
+                t = _seconds(f, int(calls * share))
+                best[k] = t if best[k] is None else min(best[k], t)
+        n = int(calls * after[name][1])
+        print(f"{name}: {n / best[0] / 1e6:.2f}M -> {n / best[1] / 1e6:.2f}M calls/s ({best[0] / best[1]:.2f}x)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark Neopixel.set_pixel() against an earlier revision.")
+    parser.add_argument("--rev", required=True, help="git revision to compare to")
+    parser.add_argument("--after", help="git revision to compare, the working tree if not given")
+    parser.add_argument("--calls", type=int, default=100000, help="calls per measurement")
+    parser.add_argument("--repeat", type=int, default=7, help="measurements, the best one counts")
+    args = parser.parse_args()
+
+    simulator.install()
+    if args.after is None:
+        from wclock.neopixel import Neopixel
+    else:
+        Neopixel = _revision(args.after)
+
+    bench(cases(_revision(args.rev)), cases(Neopixel), args.calls, args.repeat)
+    sys.exit(0)
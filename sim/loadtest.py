@@ -0,0 +1,83 @@
+"""
+Load test of the status pages under the host simulator: requests per second served by pages.render_cached with the
+page cache, with every request rendering the template (as if the state changed between requests), and for clients
+holding the current ETag. Needs the microdot and utemplate submodules.
+
+    python sim/loadtest.py [--requests 500] [--template checkmk.txt.tpl]
+"""
+import argparse
+import asyncio
+import itertools
+import os
+import sys
+import time
+
+import simulator
+
+# real time, the simulator patches the clocks of the time module only
+_perf_counter = time.perf_counter
+
+
+async def main(requests: int, template: str) -> None:
+    from microdot import Microdot, Request
+    from microdot.test_client import TestClient
+    import pages
+    from ldr import LDR
+    from sensors import SensorHub
+    from wclock import WClock
+
+    ldr = LDR(15)
+    sensors = SensorHub(ldr, 4)
+    wclock = WClock(22, ldr)
+    tasks = [asyncio.create_task(ldr.start(3)), asyncio.create_task(sensors.start()),
+             asyncio.create_task(wclock.start())]
+    # until the display shows the time
+    while wclock.frames[0] == 0:
+        await asyncio.sleep(1)
+
+    app = Microdot()
+    changes = itertools.count()
+
+    @app.get("/cached/<name>")
+    async def cached(request: Request, name: str):
+        return await pages.render_cached(request, name, 'text/plain', (sensors.version, wclock.version),
+                                         (wclock, ldr, sensors.temperature))
+
+    @app.get("/uncached/<name>")
+    async def uncached(request: Request, name: str):
+        return await pages.render_cached(request, name, 'text/plain', (next(changes),),
+                                         (wclock, ldr, sensors.temperature))
+
+    client = TestClient(app)
+    etag = (await client.get(f"/cached/{template}")).headers['ETag']
+    for label, path, headers in (("without cache", f"/uncached/{template}", None),
+                                 ("with cache", f"/cached/{template}", None),
+                                 ("conditional", f"/cached/{template}", {'If-None-Match': etag})):
+        statuses = {}
+        start = _perf_counter()
+        for i in range(requests):
+            response = await client.get(path, headers=headers)
+            statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+        elapsed = _perf_counter() - start
+        print(f"{label}: {requests / elapsed:.0f} requests/s, status {statuses}")
+
+    for task in tasks:
+        task.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the requests per second of the status pages.")
+    parser.add_argument("--requests", type=int, default=500, help="requests per measurement")
+    parser.add_argument("--template", default="checkmk.txt.tpl", help="template of the page")
+    parser.add_argument("--charge", type=float, default=0.02, help="LDR capacitor charge time (s)")
+    args = parser.parse_args()
+
+    simulator.install()
+    import machine
+
+    machine.script_pin(15, lambda t: t >= args.charge)
+    # configuration files and templates are read from the working directory, like on the device
+    os.chdir(simulator.SRC_DIR)
+    asyncio.run(main(args.requests, args.template))
+    sys.exit(0)
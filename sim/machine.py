@@ -0,0 +1,179 @@
+"""
+Stand-in for the MicroPython machine module, driven by the virtual clock of the simulator.
+"""
+import asyncio
+
+import simulator
+
+
+class Pin:
+    IN = 0
+    OUT = 1
+    PULL_UP = 1
+    PULL_DOWN = 2
+    IRQ_FALLING = 4
+    IRQ_RISING = 8
+
+    # pin id -> callable(seconds since the pin became an input) -> level
+    scripts = {}
+    # resolution of the edge detection of scripted pins (virtual seconds)
+    irq_resolution = 0.0001
+
+    def __init__(self, id, mode: int = -1, pull: int = -1, value: int | None = None) -> None:
+        self.id = id
+        self._mode = self.IN
+        self._level = 0
+        self._input_ts = simulator.clock.elapsed()
+        self._handler = None
+        self._trigger = 0
+        self._hard = False
+        self._watch = None
+        self.init(mode, pull, value)
+
+    def init(self, mode: int = -1, pull: int = -1, value: int | None = None) -> None:
+        if mode == self.IN and self._mode != self.IN:
+            self._input_ts = simulator.clock.elapsed()
+        if mode != -1:
+            self._mode = mode
+        if value is not None:
+            self._level = value
+        self._arm()
+
+    def irq(self, handler=None, trigger: int = IRQ_FALLING | IRQ_RISING, hard: bool = False) -> None:
+        self._handler = handler
+        self._trigger = trigger
+        self._hard = hard
+        self._arm()
+
+    def _arm(self) -> None:
+        # watch a scripted input for edges, while an interrupt handler is set
+        if self._watch is not None:
+            self._watch.cancel()
+            self._watch = None
+        if self._handler is not None and self._mode == self.IN and self.id in self.scripts:
+            # the level is taken now, an edge before the watch task first runs still fires
+            ts = simulator.clock.elapsed()
+            self._watch = asyncio.get_running_loop().create_task(self._edges(ts, self._scripted(ts)))
+
+    async def _edges(self, ts: float, level: int) -> None:
+        while True:
+            await asyncio.sleep(self.irq_resolution)
+            now = simulator.clock.elapsed()
+            new = self._scripted(now)
+            if new != level and self._trigger & (self.IRQ_RISING if new else self.IRQ_FALLING):
+                if self._hard:
+                    # a hard interrupt runs right at the edge, however late the watch task got to run
+                    simulator.clock.freeze(self._edge(ts, now, level))
+                    try:
+                        self._handler(self)
+                    finally:
+                        simulator.clock.freeze(None)
+                else:
+                    self._handler(self)
+            level = new
+            ts = now
+
+    def _edge(self, start: float, end: float, level: int) -> float:
+        """
+        Time of the first change of the scripted level between <start> and <end> (clock.elapsed()), to 1 us.
+        """
+        while end - start > 0.000001:
+            middle = (start + end) / 2
+            if self._scripted(middle) == level:
+                start = middle
+            else:
+                end = middle
+        return end
+
+    def _scripted(self, elapsed: float) -> int:
+        return 1 if Pin.scripts[self.id](elapsed - self._input_ts) else 0
+
+    def value(self, v: int | None = None) -> int | None:
+        if v is not None:
+            self._level = 1 if v else 0
+            return None
+        if self._mode == self.IN and self.id in Pin.scripts:
+            return self._scripted(simulator.clock.elapsed())
+        return self._level
+
+    def __call__(self, v: int | None = None) -> int | None:
+        return self.value(v)
+
+    def on(self) -> None:
+        self._level = 1
+
+    def off(self) -> None:
+        self._level = 0
+
+    high = on
+    low = off
+
+    def toggle(self) -> None:
+        self._level ^= 1
+
+
+def script_pin(id, script) -> None:
+    """
+    Script the level of an input pin.
+
+    :param id: pin id
+    :param script: callable(seconds since the pin became an input) -> level
+    """
+    Pin.scripts[id] = script
+
+
+class ADC:
+    # adc id -> value returned by read_u16(), default is ~27°C on the temperature sensor
+    values = {}
+
+    def __init__(self, id) -> None:
+        self.id = id
+
+    def read_u16(self) -> int:
+        return self.values.get(self.id, 14020)
+
+
+class Timer:
+    ONE_SHOT = 0
+    PERIODIC = 1
+
+    def __init__(self, id: int = -1, mode: int = PERIODIC, period: int = -1, freq: float = -1,
+                 callback=None) -> None:
+        self._handle = None
+        if callback is not None:
+            self.init(mode=mode, period=period, freq=freq, callback=callback)
+
+    def init(self, mode: int = PERIODIC, period: int = -1, freq: float = -1, callback=None) -> None:
+        self.deinit()
+        self._mode = mode
+        self._period = 1 / freq if freq > 0 else period / 1000
+        self._callback = callback
+        self._schedule()
+
+    def _schedule(self) -> None:
+        self._handle = asyncio.get_running_loop().call_later(simulator.clock.real(self._period), self._fire)
+
+    def _fire(self) -> None:
+        if self._mode == self.PERIODIC:
+            self._schedule()
+        else:
+            self._handle = None
+        self._callback(self)
+
+    def deinit(self) -> None:
+        if self._handle is not None:
+            self._handle.cancel()
+            self._handle = None
+
+
+class RTC:
+    def datetime(self, datetime: tuple | None = None) -> tuple | None:
+        if datetime is not None:
+            simulator.rtc_datetime(datetime)
+            return None
+        year, month, day, hours, minutes, seconds, weekday, yearday = simulator.gmtime()
+        return year, month, day, weekday, hours, minutes, seconds, 0
+
+
+def reset() -> None:
+    raise SystemExit("machine.reset()")
@@ -0,0 +1,50 @@
+"""
+Stand-in for the MicroPython rp2 module. State machines record every put() into a frame log instead of driving leds.
+"""
+import array
+import collections
+import time
+
+
+# (ticks_us, array.array('I') of the values put, shift) of every put(), most recent last
+frame_log = collections.deque(maxlen=10000)
+
+
+class PIO:
+    OUT_LOW = 0
+    OUT_HIGH = 1
+    IN_LOW = 0
+    IN_HIGH = 1
+    SHIFT_LEFT = 0
+    SHIFT_RIGHT = 1
+    JOIN_NONE = 0
+    JOIN_TX = 1
+    JOIN_RX = 2
+
+
+def asm_pio(**kwargs):
+    # the program is never assembled, the state machine only records data
+    def decorator(program):
+        return program
+
+    return decorator
+
+
+class StateMachine:
+    def __init__(self, id: int, program=None, freq: int = -1, **kwargs) -> None:
+        self.id = id
+        self._active = 0
+
+    def active(self, value: int | None = None) -> int | None:
+        if value is None:
+            return self._active
+        self._active = value
+        return None
+
+    def put(self, value, shift: int = 0) -> None:
+        values = array.array("I", [value]) if isinstance(value, int) else array.array("I", value)
+        frame_log.append((time.ticks_us(), values, shift))
+
+    def tx_fifo(self) -> int:
+        # data is consumed immediately
+        return 0
@@ -0,0 +1,51 @@
+"""
+Run the clock on the host under the simulator and report what was sent to the strip.
+
+    python sim/run.py [--speed 60] [--duration 3600] [--charge 0.02]
+"""
+import argparse
+import asyncio
+import os
+import sys
+
+import simulator
+
+
+async def main(duration: float) -> None:
+    import rp2
+    from ldr import LDR
+    from wclock import WClock
+
+    ldr = LDR(15)
+    wclock = WClock(22, ldr)
+    ldr_task = asyncio.create_task(ldr.start(3))
+    wclock_task = asyncio.create_task(wclock.start())
+
+    await asyncio.sleep(duration)
+    sent, skipped = wclock.frames
+    wakeups, renders, per_hour = wclock.scheduler_stats
+
+    wclock_task.cancel()
+    ldr_task.cancel()
+    await wclock_task
+    await ldr_task
+
+    print(f"{duration}s simulated: {sent} frames sent, {skipped} skipped, {len(rp2.frame_log)} puts logged")
+    print(f"display task: {wakeups} wakeups ({per_hour}/h), {renders} renders")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the word clock under the host simulator.")
+    parser.add_argument("--speed", type=float, default=60, help="virtual seconds per real second")
+    parser.add_argument("--duration", type=float, default=3600, help="virtual seconds to run")
+    parser.add_argument("--charge", type=float, default=0.02, help="LDR capacitor charge time (s)")
+    args = parser.parse_args()
+
+    simulator.install(args.speed)
+    import machine
+
+    machine.script_pin(15, lambda t: t >= args.charge)
+    # configuration files are read from the working directory, like on the device
+    os.chdir(simulator.SRC_DIR)
+    asyncio.run(main(args.duration))
+    sys.exit(0)
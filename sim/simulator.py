@@ -0,0 +1,154 @@
+"""
+Host simulator of the MicroPython runtime used by wclock.
+
+install() puts the stand-in modules of this directory (machine, rp2, usocket), the clock sources and the libraries
+installed on the board (the microdot and utemplate submodules) on the path, and patches the MicroPython specific parts
+of time, asyncio and sys on CPython. All of them run on a virtual clock, which may run faster than real time, so
+WClock.start() can run unchanged and be profiled with host tools, e.g.:
+
+    python -m cProfile -s cumtime sim/run.py --speed 600 --duration 3600
+"""
+import asyncio
+import calendar
+import os
+import sys
+import time
+import traceback
+
+SIM_DIR = os.path.dirname(os.path.abspath(__file__))
+ROOT_DIR = os.path.dirname(SIM_DIR)
+SRC_DIR = os.path.join(ROOT_DIR, "src")
+LIB_DIRS = (os.path.join(ROOT_DIR, "microdot", "src"), os.path.join(ROOT_DIR, "utemplate"))
+
+# MicroPython ticks wrap around at 2^30
+_TICKS_PERIOD = 1 << 30
+_TICKS_MAX = _TICKS_PERIOD - 1
+_TICKS_HALFPERIOD = _TICKS_PERIOD // 2
+
+_monotonic = time.monotonic
+_sleep = time.sleep
+_asleep = asyncio.sleep
+_gmtime = time.gmtime
+
+
+class VirtualClock:
+    def __init__(self, speed: float = 1.0, start: float | None = None) -> None:
+        """
+        :param speed: virtual seconds per real second
+        :param start: virtual UTC time (epoch seconds) to start from, real time if None
+        """
+        self.speed = speed
+        self._t0 = _monotonic()
+        self._start = time.time() if start is None else start
+        self._elapsed = 0.0
+        self._frozen = None
+
+    def now(self) -> float:
+        """
+        Virtual UTC time in seconds.
+        """
+        return self._start + self.elapsed()
+
+    def elapsed(self) -> float:
+        """
+        Virtual seconds since the clock was created (not affected by setting the time).
+        """
+        if self._frozen is not None:
+            return self._frozen
+        return (_monotonic() - self._t0) * self.speed
+
+    def freeze(self, elapsed: float | None) -> None:
+        """
+        Stop the clock at <elapsed> (see elapsed()), e.g. to run an interrupt handler at the time of its event, None
+        lets it run again.
+        """
+        self._frozen = elapsed
+
+    def set(self, utc: float) -> None:
+        self._start = utc - self.elapsed()
+
+    def real(self, seconds: float) -> float:
+        """
+        Real duration of <seconds> virtual seconds.
+        """
+        return seconds / self.speed
+
+
+clock = VirtualClock()
+
+
+def _ticks(scale: int) -> int:
+    return int(clock.elapsed() * scale) & _TICKS_MAX
+
+
+def ticks_diff(ticks1: int, ticks2: int) -> int:
+    return ((ticks1 - ticks2 + _TICKS_HALFPERIOD) & _TICKS_MAX) - _TICKS_HALFPERIOD
+
+
+def ticks_add(ticks: int, delta: int) -> int:
+    return (ticks + delta) & _TICKS_MAX
+
+
+def gmtime(secs: float | None = None) -> tuple:
+    return tuple(_gmtime(clock.now() if secs is None else secs))[:8]
+
+
+def rtc_datetime(datetime: tuple) -> None:
+    """
+    Set the virtual clock from an RTC datetime tuple (year, month, day, weekday, hours, minutes, seconds, subseconds).
+    """
+    year, month, day, weekday, hours, minutes, seconds, subseconds = datetime
+    clock.set(calendar.timegm((year, month, day, hours, minutes, seconds, 0, 0, 0)))
+
+
+class ThreadSafeFlag(asyncio.Event):
+    """
+    Like asyncio.Event, but cleared by wait(), as in MicroPython.
+    """
+
+    async def wait(self) -> bool:
+        await super().wait()
+        self.clear()
+        return True
+
+
+async def _wait_for_ms(aw, timeout: int):
+    return await asyncio.wait_for(aw, clock.real(timeout / 1000))
+
+
+def install(speed: float = 1.0, start: float | None = None) -> VirtualClock:
+    """
+    Install the simulator. Must be called before importing any of the clock modules.
+
+    :param speed: virtual seconds per real second
+    :param start: virtual UTC time (epoch seconds) to start from, real time if None
+    :return: the virtual clock
+    """
+    global clock
+    clock = VirtualClock(speed, start)
+
+    for path in LIB_DIRS + (SRC_DIR, SIM_DIR):
+        if path not in sys.path:
+            sys.path.insert(0, path)
+
+    time.time = lambda: int(clock.now())
+    time.time_ns = lambda: int(clock.now() * 1000000000)
+    time.gmtime = gmtime
+    time.localtime = gmtime
+    time.ticks_us = lambda: _ticks(1000000)
+    time.ticks_ms = lambda: _ticks(1000)
+    time.ticks_cpu = time.ticks_us
+    time.ticks_diff = ticks_diff
+    time.ticks_add = ticks_add
+    time.sleep = lambda seconds: _sleep(clock.real(seconds))
+    time.sleep_ms = lambda ms: _sleep(clock.real(ms / 1000))
+    time.sleep_us = lambda us: _sleep(clock.real(us / 1000000))
+
+    asyncio.sleep = lambda seconds, result=None: _asleep(clock.real(seconds), result)
+    asyncio.sleep_ms = lambda ms: _asleep(clock.real(ms / 1000))
+    asyncio.wait_for_ms = _wait_for_ms
+    asyncio.ThreadSafeFlag = ThreadSafeFlag
+
+    sys.print_exception = lambda e, file=sys.stdout: traceback.print_exception(e, file=file)
+
+    return clock
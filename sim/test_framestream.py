@@ -0,0 +1,86 @@
+"""
+FrameStream of frames shown on the simulated state machine.
+
+    python -m pytest sim
+"""
+import array
+import asyncio
+import json
+
+import simulator
+
+
+class Clock:
+    # the part of WClock a FrameStream reads
+    def __init__(self, strip):
+        self.strip = strip
+
+
+async def _read(stream, messages: list, pause: float = 0) -> None:
+    while True:
+        messages.append(await stream.next())
+        await asyncio.sleep(pause)
+
+
+def _apply(messages: list, num_leds: int) -> array.array:
+    """
+    Frame a client rebuilds from the messages, packed as in Neopixel.front.
+    """
+    size = json.loads(messages[0])["bytes"]
+    low = 8 * (4 - size)
+    frame = array.array('I', [0] * num_leds)
+    for m in messages[1:]:
+        if m[:1] == b"K":
+            for i in range(num_leds):
+                frame[i] = int.from_bytes(m[1 + size * i:1 + size * (i + 1)], "little") << low
+        else:
+            for n in range((len(m) - 1) // (size + 1)):
+                record = m[1 + (size + 1) * n:1 + (size + 1) * (n + 1)]
+                frame[record[0]] = int.from_bytes(record[1:], "little") << low
+    return frame
+
+
+def test_bytes_per_minute():
+    simulator.install(600)
+    from framestream import FrameStream
+    from wclock.neopixel import Neopixel
+
+    minutes = 10
+    strip = Neopixel(11 * 11, 1, 22, "GRB")
+
+    async def run():
+        fast = []
+        slow = []
+        readers = [asyncio.create_task(_read(FrameStream(Clock(strip)), fast)),
+                   asyncio.create_task(_read(FrameStream(Clock(strip)), slow, 150))]
+        strip.fill((0, 0, 40))
+        await strip.show_async()
+        await asyncio.sleep(1)
+        steady = len(fast)
+        for minute in range(minutes):
+            # the words of the next minute: a few leds change, and redraws in between send nothing
+            for i in range(8):
+                strip.set_pixel(8 * minute + i, (255, 255, 255))
+                strip.set_pixel(8 * minute + i - 8, (0, 0, 40))
+            await strip.show_async()
+            for redraw in range(3):
+                await asyncio.sleep(15)
+                await strip.show_async()
+        await asyncio.sleep(1)
+        for reader in readers:
+            reader.cancel()
+        return fast, slow, steady
+
+    fast, slow, steady = asyncio.run(run())
+    assert isinstance(fast[0], str) and fast[1][:1] == b"K" and len(fast[1]) == 1 + 3 * 121
+    assert strip.frames_sent == 1 + minutes and strip.frames_skipped == 3 * minutes
+
+    # one delta of 16 changed leds per minute instead of 364 bytes per frame sent
+    per_minute = sum(len(m) for m in fast[steady:]) / minutes
+    assert len(fast) - steady == minutes
+    assert per_minute <= 1 + 4 * 16
+    assert _apply(fast, 121) == strip.front
+
+    # a slow client skips frames, but ends up with the same one
+    assert len(slow) < len(fast)
+    assert _apply(slow, 121) == strip.front
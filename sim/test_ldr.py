@@ -0,0 +1,49 @@
+"""
+LDR charge timing against scripted edges of the simulator.
+
+    python -m pytest sim
+"""
+import asyncio
+
+import pytest
+
+import simulator
+
+
+async def _measure(n: int) -> list:
+    from ldr import LDR
+
+    ldr = LDR(15, filter=None)
+    charges = []
+    ldr.subscribe(charges.append)
+    task = asyncio.create_task(ldr.start(1))
+    while len(charges) < n:
+        await asyncio.sleep(0.1)
+    task.cancel()
+    await task
+    return charges
+
+
+@pytest.mark.parametrize("speed", [1, 60, 600])
+@pytest.mark.parametrize("charge", [0.002, 0.02, 0.2])
+def test_edge(speed, charge):
+    simulator.install(speed)
+    import machine
+
+    machine.script_pin(15, lambda t: t >= charge)
+    charges = asyncio.run(_measure(3))
+    # no edge is missed (a missed edge reads as the 1 s timeout)
+    for measured in charges:
+        assert charge * 1000000 - 1 <= measured < 1000000, charges
+    # the interrupt timestamps the edge however late the watch task runs, only the code between taking the start
+    # time and switching the pin to input adds a few real us (more, if the host stalls right there)
+    assert sorted(charges)[1] < charge * 1000000 + 100 + 20 * speed, charges
+
+
+def test_dark():
+    simulator.install(60)
+    import machine
+
+    machine.script_pin(15, lambda t: False)
+    for measured in asyncio.run(_measure(2)):
+        assert measured >= 1000000
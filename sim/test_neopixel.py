@@ -0,0 +1,90 @@
+"""
+Neopixel on the simulated state machine.
+
+    python -m pytest sim
+"""
+import asyncio
+import time
+
+import simulator
+
+
+def _strip(delay: float):
+    from wclock.neopixel import Neopixel
+
+    strip = Neopixel(11 * 11, 1, 22, "GRB", delay)
+    strip.set_pixel(0, (255, 0, 0))
+    return strip
+
+
+async def _during(show) -> tuple[int, int]:
+    """
+    Ticks of a concurrent task and virtual ms taken while show() runs.
+    """
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep_ms(1)
+
+    task = asyncio.create_task(ticker())
+    await asyncio.sleep(0)
+    before = ticks
+    start = time.ticks_ms()
+    await show()
+    elapsed = time.ticks_diff(time.ticks_ms(), start)
+    during = ticks - before
+    task.cancel()
+    return during, elapsed
+
+
+def test_show_async_yields_while_latching():
+    simulator.install()
+    import rp2
+
+    strip = _strip(0.05)
+    puts = len(rp2.frame_log)
+    during, elapsed = asyncio.run(_during(strip.show_async))
+    assert len(rp2.frame_log) == puts + 1
+    assert elapsed >= strip.latch_ms
+    # the other task ran throughout the latch, not just once
+    assert during >= 10
+
+
+def test_words_put():
+    simulator.install()
+    import rp2
+
+    strip = _strip(0.05)
+    strip.show()
+    ticks, values, shift = rp2.frame_log[-1]
+    # GRB: the 24 bit state machine sends the top 3 bytes of each word, green first
+    assert (values[0] << shift) & 0xffffffff == 0x00ff0000
+    assert values == strip.front
+
+
+def test_show_blocks_while_latching():
+    simulator.install()
+
+    strip = _strip(0.05)
+
+    async def show():
+        strip.show()
+
+    during, elapsed = asyncio.run(_during(show))
+    assert elapsed >= 50
+    assert during == 0
+
+
+def test_show_async_skips_unchanged():
+    simulator.install()
+    import rp2
+
+    strip = _strip(0.05)
+    asyncio.run(strip.show_async())
+    puts = len(rp2.frame_log)
+    during, elapsed = asyncio.run(_during(strip.show_async))
+    assert len(rp2.frame_log) == puts
+    assert strip.frames_skipped == 1
@@ -0,0 +1,148 @@
+"""
+NTPSync against NTP responders on local UDP ports.
+
+    python -m pytest sim
+"""
+import asyncio
+import socket
+import struct
+import threading
+import time
+
+import pytest
+
+import simulator
+
+_NTP_DELTA = 2208988800
+
+
+class Responder(threading.Thread):
+    def __init__(self, offset: float = 0.0, delay: float = 0.0, header: int = 0x24, origin: bool = True,
+                 silent: bool = False):
+        """
+        NTP server answering on 127.0.0.1 with a clock <offset> (s) ahead of the virtual clock, after <delay> (s).
+
+        :param header: first byte of the answers: LI, version and mode (default: LI 0, version 4, mode 4)
+        :param origin: echo the transmit timestamp of the query as origin
+        :param silent: never answer
+        """
+        super().__init__(daemon=True)
+        self.offset = offset
+        self.delay = delay
+        self.header = header
+        self.origin = origin
+        self.silent = silent
+        self.queries = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("127.0.0.1", 0))
+        self.sock.settimeout(0.05)
+        self.host = f"127.0.0.1:{self.sock.getsockname()[1]}"
+        self.stopped = threading.Event()
+
+    def _timestamp(self) -> bytes:
+        ns = time.time_ns() + int(self.offset * 1000000000)
+        sec = ns // 1000000000
+        return struct.pack("!II", sec + _NTP_DELTA, ((ns - sec * 1000000000) << 32) // 1000000000)
+
+    def run(self) -> None:
+        while not self.stopped.is_set():
+            try:
+                query, address = self.sock.recvfrom(48)
+            except socket.timeout:
+                continue
+            self.queries += 1
+            if self.silent:
+                continue
+            received = self._timestamp()
+            time.sleep(self.delay)
+            answer = bytearray(48)
+            answer[0] = self.header
+            answer[1] = 2
+            answer[24:32] = query[40:48] if self.origin else bytes(8)
+            answer[32:40] = received
+            answer[40:48] = self._timestamp()
+            self.sock.sendto(answer, address)
+        self.sock.close()
+
+
+@pytest.fixture
+def responders(tmp_path, monkeypatch):
+    """
+    Start responders and make them the servers of NTPSync.
+    """
+    simulator.install()
+    import config
+    from ntpsync import NTPSync
+
+    # ntp.json of the test, never written
+    monkeypatch.chdir(tmp_path)
+    started = []
+
+    def start(*servers: Responder) -> NTPSync:
+        for server in servers:
+            server.start()
+            started.append(server)
+        config.store.set(NTPSync._NTP_CONFIG, {"hosts": [server.host for server in servers]})
+        return NTPSync()
+
+    yield start
+    for server in started:
+        server.stopped.set()
+        server.join()
+    config.store._configs.pop(NTPSync._NTP_CONFIG, None)
+    config.store._dirty.clear()
+
+
+def test_lowest_delay(responders):
+    servers = (Responder(1.0, 0.06), Responder(2.0, 0.01), Responder(3.0, 0.03))
+    ntp = responders(*servers)
+    offset, delay, host = asyncio.run(ntp.query())
+    assert host == servers[1].host
+    # the server holds the answer after taking the receive timestamp, that is not part of the delay
+    assert abs(offset - 2000000000) < 10000000
+    assert 0 < delay < 10000000
+    assert all(server.queries == 1 for server in servers)
+
+
+@pytest.mark.parametrize("bad", [
+    {"header": 0x23},       # mode 3: a client query reflected
+    {"header": 0xe4},       # LI 3: unsynchronized server
+    {"origin": False},      # not an answer to our query
+], ids=["mode", "leap", "origin"])
+def test_invalid_answers(responders, bad, capsys):
+    bad = Responder(**bad)
+    good = Responder(1.0, 0.05)
+    ntp = responders(bad, good)
+    # the invalid answer is faster, but never picked
+    offset, delay, host = asyncio.run(ntp.query())
+    assert host == good.host
+    assert bad.queries == 1
+    assert f"NTP {bad.host}: invalid answer" in capsys.readouterr().out
+    # resolved again by the next query
+    assert list(ntp._addresses) == [good.host]
+
+
+def test_timeout(responders, monkeypatch):
+    import ntpsync
+
+    ntp = responders(Responder(silent=True), Responder(silent=True))
+    start = time.ticks_ms()
+    assert asyncio.run(ntp.query(timeout_ms=300)) is None
+    assert 300 <= time.ticks_diff(time.ticks_ms(), start) < 1000
+    assert ntp._addresses == {}
+
+    # no answer never sets the RTC
+    settings = []
+    monkeypatch.setattr(simulator, "rtc_datetime", settings.append)
+    monkeypatch.setattr(ntp, "query", lambda: ntpsync.NTPSync.query(ntp, timeout_ms=100))
+    failures = ntpsync._failures.value
+
+    async def sync():
+        task = asyncio.create_task(ntp.start_sync())
+        await asyncio.sleep(0.5)
+        task.cancel()
+
+    asyncio.run(sync())
+    assert settings == []
+    assert ntp.offset is None
+    assert ntpsync._failures.value > failures
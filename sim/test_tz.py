@@ -0,0 +1,66 @@
+"""
+POSIX TZ rules of tz.TZ against the tz database of the host, through 2100.
+
+    python -m pytest sim
+"""
+import bisect
+import calendar
+from datetime import datetime, timezone
+from zoneinfo import ZoneInfo
+
+import pytest
+
+import simulator
+
+simulator.install()
+from tz import TZ
+
+_END = calendar.timegm((2100, 1, 1, 0, 0, 0))
+_GRID = 3 * 3600
+
+# rule (last line of /usr/share/zoneinfo/<zone>), zone, first year the rule holds
+ZONES = [
+    ("CET-1CEST,M3.5.0,M10.5.0/3", "Europe/Budapest", 1996),
+    ("IST-1GMT0,M10.5.0,M3.5.0/1", "Europe/Dublin", 1997),
+    ("EST5EDT,M3.2.0,M11.1.0", "America/New_York", 2007),
+    ("AEST-10AEDT,M10.1.0,M4.1.0/3", "Australia/Sydney", 2008),
+    ("<+1030>-10:30<+11>-11,M10.1.0,M4.1.0", "Australia/Lord_Howe", 2008),
+    ("NZST-12NZDT,M9.5.0,M4.1.0/3", "Pacific/Auckland", 2008),
+    ("<-04>4<-03>,M9.1.6/24,M4.1.6/24", "America/Santiago", 2023),
+    ("<-02>2<-01>,M3.5.0/-1,M10.5.0/0", "America/Godthab", 2024),
+    ("JST-9", "Asia/Tokyo", 1952),
+]
+
+
+def _offset(zone: ZoneInfo, utc: int) -> int:
+    return int(datetime.fromtimestamp(utc, timezone.utc).astimezone(zone).utcoffset().total_seconds())
+
+
+@pytest.mark.parametrize("rule, name, year", ZONES, ids=[name for rule, name, year in ZONES])
+def test_zone(rule, name, year):
+    tz = TZ(rule)
+    zone = ZoneInfo(name)
+    start = calendar.timegm((year, 1, 1, 0, 0, 0))
+
+    # every transition: the offset changes there, and only there
+    transitions = []
+    utc = start
+    while True:
+        utc = tz.next_transition(utc)
+        if utc >= _END:
+            break
+        assert tz.offset(utc - 1) == _offset(zone, utc - 1), utc
+        assert tz.offset(utc) == _offset(zone, utc), utc
+        assert _offset(zone, utc - 1) != _offset(zone, utc), utc
+        transitions.append(utc)
+    years = 2100 - year
+    assert len(transitions) == (0 if name == "Asia/Tokyo" else 2 * years)
+
+    # the offset and the next transition anywhere in between
+    for utc in range(start, _END, _GRID):
+        assert tz.offset(utc) == _offset(zone, utc), utc
+        i = bisect.bisect_right(transitions, utc)
+        if i < len(transitions):
+            assert tz.next_transition(utc) == transitions[i], utc
+        else:
+            assert tz.next_transition(utc) >= _END, utc
@@ -0,0 +1,4 @@
+"""
+Stand-in for the MicroPython usocket module.
+"""
+from socket import *
@@ -1,12 +1,97 @@
+import asyncio
 import json
+import os
+import sys
+
+import metrics
+
+
+class ConfigStore:
+    def __init__(self, delay_ms: int = 2000):
+        """
+        Config files parsed once and served from memory. Changes are written behind: writes coming within
+        <delay_ms> of each other are coalesced into one write per file, done by the start() task.
+
+        :param delay_ms: debounce window of the writes
+        """
+        self._delay_ms = delay_ms
+        self._configs = {}
+        self._dirty = []
+        self._changed = asyncio.Event()
+        self.pending = 0
+        self.flushed = 0
+
+    def get(self, file: str) -> dict:
+        """
+        Config of a json file, the file is read on first use only. Do not modify it, set() a new one.
+        """
+        config = self._configs.get(file)
+        if config is None:
+            with open(file) as f:
+                config = json.load(f)
+            self._configs[file] = config
+        return config
+
+    def set(self, file: str, config: dict) -> None:
+        """
+        Replace the config of a file, it is written to flash after the debounce window.
+        """
+        self._configs[file] = config
+        if file not in self._dirty:
+            self._dirty.append(file)
+        self.pending += 1
+        self._changed.set()
+
+    def flush(self, file: str | None = None) -> None:
+        """
+        Write a changed file (all, if None) now. Files are written to a temporary file first and renamed, so a
+        reset never leaves a truncated config behind.
+        """
+        for f in ([file] if file is not None else list(self._dirty)):
+            if f not in self._dirty:
+                continue
+            tmp = f + ".tmp"
+            with open(tmp, "w") as out:
+                json.dump(self._configs[f], out)
+            os.rename(tmp, f)
+            self._dirty.remove(f)
+            self.flushed += 1
+            _flushes.inc()
+        if not self._dirty:
+            self.pending = 0
+
+    async def start(self):
+        try:
+            while True:
+                await self._changed.wait()
+                # wait until no change arrived for a debounce window
+                while self._changed.is_set():
+                    self._changed.clear()
+                    try:
+                        await asyncio.wait_for_ms(self._changed.wait(), self._delay_ms)
+                    except asyncio.TimeoutError:
+                        pass
+                try:
+                    self.flush()
+                except Exception as e:
+                    sys.print_exception(e)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            self.flush()
+
+
+store = ConfigStore()
+_flushes = metrics.counter("config_flushes", "Config files written to flash.")
+metrics.gauge("config_pending_writes", "Config changes not yet written to flash.", lambda: store.pending)
 
 
 def config_load(file, *args: str) -> tuple:
-    with open(file) as f:
-        config = json.load(f)
+    config = store.get(file)
     return tuple(config[k] for k in args)
 
 
 def config_save(file, **kwargs):
-    with open(file, "w") as f:
-        json.dump(kwargs, f)
+    # written at once, the caller may reset the board right after
+    store.set(file, kwargs)
+    store.flush(file)
@@ -0,0 +1,85 @@
+import asyncio
+import json
+
+
+class FrameStream:
+    def __init__(self, wclock):
+        """
+        Frames sent to the strip of a clock, for one client: a keyframe first, then the changes only. A client that
+        reads slower than the frames are sent gets the difference to the latest frame, intermediate frames are
+        dropped instead of queued.
+
+        Messages:
+            text    layout of the values (json), whenever the strip is (re)created: number of leds, bytes per
+                    value, bit position of the r, g, b, w channels in a value
+            b"K"    value of each led (little endian, the channel bytes of Neopixel.front), follows the layout
+            b"D"    (u8 led, value) of each changed led, strips up to 256 leds
+
+        :param wclock: clock streamed
+        """
+        self._wclock = wclock
+        self._strip = None
+        self._last = None
+        self._generation = None
+        self._size = 3
+        # bits below the channels of a value: the empty lowest byte in RGB mode
+        self._low = 8
+
+    async def next(self) -> str | bytes:
+        """
+        Wait for a frame differing from the last one returned and return its message.
+        """
+        while True:
+            strip = self._wclock.strip
+            if strip is None:
+                await asyncio.sleep(1)
+                continue
+            if strip is not self._strip:
+                self._strip = strip
+                self._size = 4 if strip.W_in_mode else 3
+                self._low = 8 * (4 - self._size)
+                self._last = None
+                shift = [s - self._low for s in strip.shift[:self._size]]
+                return json.dumps({"num_leds": strip.num_leds, "bytes": self._size, "shift": shift})
+            if self._last is None:
+                self._generation = strip.frames_sent
+                self._last = strip.front[:]
+                return self._keyframe()
+            if strip.frames_sent != self._generation:
+                self._generation = strip.frames_sent
+                message = self._delta()
+                if message is not None:
+                    return message
+            await strip.sent.wait()
+
+    def _value(self, out: bytearray, pos: int, value: int) -> None:
+        value >>= self._low
+        for i in range(self._size):
+            out[pos + i] = (value >> (8 * i)) & 255
+
+    def _keyframe(self) -> bytes:
+        size = self._size
+        last = self._last
+        out = bytearray(1 + size * len(last))
+        out[0] = ord("K")
+        for i in range(len(last)):
+            self._value(out, 1 + size * i, last[i])
+        return bytes(out)
+
+    def _delta(self) -> bytes | None:
+        front = self._strip.front
+        last = self._last
+        changed = [i for i in range(len(front)) if front[i] != last[i]]
+        if not changed:
+            return None
+        for i in changed:
+            last[i] = front[i]
+        size = self._size
+        if (size + 1) * len(changed) >= size * len(last):
+            return self._keyframe()
+        out = bytearray(1 + (size + 1) * len(changed))
+        out[0] = ord("D")
+        for n, i in enumerate(changed):
+            out[1 + (size + 1) * n] = i
+            self._value(out, 2 + (size + 1) * n, front[i])
+        return bytes(out)
@@ -1,37 +1,86 @@
+import array
 import asyncio
 import sys
 import time
 
 from machine import Pin
 
+import metrics
+import trace
+
+_measurement_time = metrics.histogram("ldr_measurement_seconds", "Time to drain and charge the capacitor.",
+                                      (100000, 125000, 150000, 200000, 300000, 500000, 1000000, 2000000, 5000000))
+_measure = trace.Span("measure", "ldr")
+
 
 class LDR:
-    def __init__(self, pin: int):
+    def __init__(self, pin: int, irq: bool = True, filter: str | None = "median", window: int = 5):
+        """
+        Measures light by the time the LDR charges a capacitor.
+
+        :param pin: pin of the LDR/capacitor
+        :param irq: timestamp the end of the charge by a rising edge interrupt, otherwise poll the pin
+        :param filter: "median" (of the last <window> measurements), "ema" (exponential moving average over
+        <window> measurements) or None
+        :param window: number of measurements filtered
+        """
+        assert filter in (None, "median", "ema"), f"invalid filter: {filter}"
         self._value = 0
         self._value_lock = asyncio.Lock()
+        self._callbacks = []
 
         self._pin = pin
+        self._irq = irq
+        self._edge = asyncio.ThreadSafeFlag()
+        self._edge_ts = 0
+
+        self._filter = filter
+        self._samples = array.array('I', [0] * window)
+        self._count = 0
+        self._raw = None
+
+    def _on_edge(self, pin: Pin) -> None:
+        self._edge_ts = time.ticks_us()
+        self._edge.set()
 
     async def start(self, refresh_period: int):
         ldr = Pin(self._pin, Pin.IN)
         try:
             while True:
                 try:
-                    cycle_ts = time.ticks_us()
-
-                    print("Drain capacitor...", end='')
-                    # drain capacity
-                    ldr.init(ldr.OUT)
-                    ldr.low()
-                    await asyncio.sleep(0.1)
-
-                    print("OK\nCharge...", end='')
-                    low_ts = time.ticks_us()
-                    ldr.init(ldr.IN)
-                    while ldr.value() == 0 and time.diff(time.ticks_us(), cycle_ts) < refresh_period * 1000000:
-                        await asyncio.sleep_ms(10)
-                    self.charge = time.ticks_diff(time.ticks_us(), low_ts)
-                    print(f"OK ({self.charge}us)")
+                    with _measure:
+                        cycle_ts = time.ticks_us()
+
+                        print("Drain capacitor...", end='')
+                        # drain capacity
+                        ldr.init(ldr.OUT)
+                        ldr.low()
+                        await asyncio.sleep(0.1)
+
+                        print("OK\nCharge...", end='')
+                        if self._irq:
+                            self._edge.clear()
+                            ldr.irq(trigger=Pin.IRQ_RISING, handler=self._on_edge, hard=True)
+                            low_ts = time.ticks_us()
+                            ldr.init(ldr.IN)
+                            try:
+                                await asyncio.wait_for_ms(self._edge.wait(), refresh_period * 1000)
+                                charge = time.ticks_diff(self._edge_ts, low_ts)
+                            except asyncio.TimeoutError:
+                                # darker than we can measure
+                                charge = time.ticks_diff(time.ticks_us(), low_ts)
+                            finally:
+                                ldr.irq(handler=None)
+                        else:
+                            low_ts = time.ticks_us()
+                            ldr.init(ldr.IN)
+                            while ldr.value() == 0 and time.ticks_diff(time.ticks_us(),
+                                                                       cycle_ts) < refresh_period * 1000000:
+                                await asyncio.sleep_ms(10)
+                            charge = time.ticks_diff(time.ticks_us(), low_ts)
+                        _measurement_time.observe(time.ticks_diff(time.ticks_us(), cycle_ts))
+                        self.charge = self._filtered(charge)
+                        print(f"OK ({charge}us -> {self.charge}us)")
 
                 except asyncio.CancelledError:
                     raise
@@ -42,8 +91,38 @@ class LDR:
         except asyncio.CancelledError:
             pass
         finally:
+            ldr.irq(handler=None)
             ldr.init(ldr.IN)
 
+    def _filtered(self, charge: int) -> int:
+        """
+        Add a measurement to the ring buffer and return the filtered value.
+        """
+        self._raw = charge
+        samples = self._samples
+        window = len(samples)
+        if self._filter == "ema":
+            if self._count == 0:
+                samples[0] = charge
+            else:
+                samples[0] += (charge - samples[0]) * 2 // (window + 1)
+            self._count += 1
+            return samples[0]
+
+        samples[self._count % window] = charge
+        self._count += 1
+        if self._filter is None:
+            return charge
+        n = min(self._count, window)
+        return sorted(samples[:n])[n // 2]
+
+    @property
+    def raw(self) -> int | None:
+        """
+        Last unfiltered measurement (us).
+        """
+        return self._raw
+
     @property
     def charge(self) -> int | None:
         return self._value
@@ -51,3 +130,15 @@ class LDR:
     @charge.setter
     def charge(self, v: float):
         self._value = v
+        for callback in self._callbacks:
+            callback(v)
+
+    def subscribe(self, callback) -> None:
+        """
+        Call callback(charge) on every new measurement.
+        """
+        self._callbacks.append(callback)
+
+    def unsubscribe(self, callback) -> None:
+        if callback in self._callbacks:
+            self._callbacks.remove(callback)
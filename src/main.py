@@ -4,11 +4,16 @@ import time
 import machine
 import network
 
-from config import config_load
+from config import config_load, store
+from framestream import FrameStream
+import metrics
+import trace
 from ldr import LDR
-from microdot import Microdot, Request
-from microdot.utemplate import Template
+from microdot import Microdot, Request, Response
+from microdot.websocket import with_websocket
 from ntpsync import NTPSync
+import pages
+from sensors import SensorHub
 from wclock import WClock
 from wifi import WIFI_CONFIG, wifiapp
 
@@ -17,29 +22,26 @@ def myprint(*values: object, sep: str | None = " ", end: str | None = "\n") -> N
     print(*values, sep=sep, end=end)
 
 
-btmp_adcpin = 4
-btmp_sensor = machine.ADC(btmp_adcpin)
-
-
-def boardttemp() -> float:
-    adc_value = btmp_sensor.read_u16()
-    volt = (3.3 / 65535) * adc_value
-    temperature = 27 - (volt - 0.706) / 0.001721
-    return round(temperature, 1)
-
-
 myprint(f"Booting")
 
 # 0. LED
 led = machine.Pin("LED", machine.Pin.OUT)
 led.on()
 
+# write config changes behind
+config_task = asyncio.create_task(store.start())
+
 # start measuring light environment
 ldr = LDR(15)
 ldr_task = asyncio.create_task(ldr.start(3))
 
-# wclock
-wclock = WClock(22, ldr)
+# sample sensors in the background
+sensors = SensorHub(ldr, 4)
+sensors_task = asyncio.create_task(sensors.start(1))
+
+# wclock, showing the time corrected by NTP
+ntp = NTPSync()
+wclock = WClock(22, ldr, ntp.time)
 wclock_task = asyncio.create_task(wclock.start())
 
 # 1. WLAN-Verbindung herstellen
@@ -77,17 +79,33 @@ if not wlan.isconnected():
 myprint(f"IP: {wlan.ifconfig()[0]}")
 
 # start syncing time
-ntp = NTPSync()
+ntp.subscribe(lambda tm: wclock.refresh())
 ntp_task = asyncio.create_task(ntp.start_sync())
 
 # web
 app = Microdot()
+# larger bodies are left in the stream instead of being read into a bytes object, see /frames
+Request.max_body_length = 1024
 app.mount(wifiapp, url_prefix='/wifi')
+http_requests = metrics.counter("http_requests", "HTTP requests served.")
+
+
+@app.before_request
+async def count_request(request: Request):
+    http_requests.inc()
+
+
+async def render_cached(request: Request, template: str, content_type: str, max_age: int = 0):
+    """
+    Render a template of the clock state, see pages.render_cached.
+    """
+    return await pages.render_cached(request, template, content_type, (sensors.version, wclock.version),
+                                     (wclock, ldr, sensors.temperature), max_age)
 
 
 @app.get("/")
 async def index(request: Request):
-    return await Template('index.html.tpl').render_async(wclock, ldr, boardttemp()), {'Content-Type': 'text/html'}
+    return await render_cached(request, 'index.html.tpl', 'text/html')
 
 
 @app.post("/charge2brightness")
@@ -95,9 +113,85 @@ async def charge2brightness(request: Request):
     wclock.charge2brightness = {int(key): tuple(map(int, values[0].split(','))) for key, values in request.form.items()}
 
 
+@app.post("/time")
+async def refresh(request: Request):
+    wclock.refresh()
+    return Response.redirect('/')
+
+
 @app.get("/checkmk")
 async def checkmk(request: Request):
-    return await Template('checkmk.txt.tpl').render_async(wclock, ldr, boardttemp()), {'Content-Type': 'text/ascii'}
+    # pollers may accept a page up to ?max_age=<s> old
+    try:
+        max_age = int(request.args.get('max_age', 0))
+    except ValueError:
+        max_age = -1
+    if max_age < 0:
+        return 'Invalid max_age', 400
+    return await render_cached(request, 'checkmk.txt.tpl', 'text/ascii', max_age)
+
+
+@app.get("/metrics")
+async def metrics_(request: Request):
+    return metrics.REGISTRY.expose(), {'Content-Type': metrics.Registry.CONTENT_TYPE}
+
+
+@app.get("/trace")
+async def trace_get(request: Request):
+    # save as .json and open in chrome://tracing or ui.perfetto.dev
+    return trace.chrome_trace()
+
+
+@app.post("/trace")
+async def trace_set(request: Request):
+    trace.enable(request.args.get('enabled', '1') == '1')
+    return {'enabled': trace.enabled}
+
+
+@app.route("/framebuffer")
+@with_websocket
+async def framebuffer(request: Request, ws):
+    # each client diffs against its own last frame, a slow client skips frames and never holds up the display
+    stream = FrameStream(wclock)
+    while True:
+        await ws.send(await stream.next())
+
+
+@app.post("/frames")
+async def frames(request: Request):
+    # raw frames, see WClock.upload
+    if request.content_length > wclock.upload_max:
+        return f'Upload too large, max {wclock.upload_max} bytes', 413
+    try:
+        n = await wclock.upload(request.stream, request.content_length, int(request.args.get('ms', 10000)))
+    except ValueError as e:
+        return str(e), 400
+    return {'frames': n}
+
+
+@app.get("/history/<sensor>")
+async def history(request: Request, sensor: str):
+    if sensor not in sensors.sensors:
+        return 'Unknown sensor', 404
+    try:
+        tier = int(request.args.get('tier', 0))
+        n = request.args.get('n')
+        n = None if n is None else int(n)
+    except ValueError as e:
+        return str(e), 400
+    if n is not None and n < 0:
+        return 'Invalid n', 400
+    if not 0 <= tier < sensors.tiers:
+        return 'Unknown tier', 404
+    h = sensors.history(sensor, tier)
+    mins, maxs, means = h.slice(n)
+    return {'period': h.period, 'min': mins, 'max': maxs, 'mean': means}
+
+
+@app.get("/ntp")
+async def ntp_status(request: Request):
+    return {'offset': ntp.offset, 'delay': ntp.delay, 'drift': ntp.drift, 'interval': ntp.interval,
+            'history': ntp.history}
 
 
 async def main():
@@ -106,10 +200,14 @@ async def main():
 
     wclock_task.cancel()
     ntp_task.cancel()
+    sensors_task.cancel()
     ldr_task.cancel()
+    config_task.cancel()
     await wclock_task
     await ntp_task
+    await sensors_task
     await ldr_task
+    await config_task
 
 
 asyncio.run(main())
@@ -0,0 +1,134 @@
+import array
+import gc
+
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        """
+        Monotonic counter.
+
+        :param name: metric name, without the _total suffix
+        :param help: description
+        """
+        self.name = name
+        self.help = help
+        self.value = 0
+
+    def inc(self, n: int = 1) -> None:
+        self.value += n
+
+    def expose(self, out: list) -> None:
+        out.append(f"# TYPE {self.name} counter\n# HELP {self.name} {self.help}\n{self.name}_total {self.value}\n")
+
+
+class Gauge:
+    def __init__(self, name: str, help: str, fn=None):
+        """
+        Value that goes up and down.
+
+        :param name: metric name
+        :param help: description
+        :param fn: if given, the value is read from fn() at exposition instead of being set
+        """
+        self.name = name
+        self.help = help
+        self.value = 0
+        self._fn = fn
+
+    def set(self, value) -> None:
+        self.value = value
+
+    def expose(self, out: list) -> None:
+        value = self.value if self._fn is None else self._fn()
+        out.append(f"# TYPE {self.name} gauge\n# HELP {self.name} {self.help}\n{self.name} {value}\n")
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, bounds: tuple, divisor: int = 1):
+        """
+        Counts of observations in fixed buckets, the memory does not grow with the number of observations.
+
+        :param name: metric name
+        :param help: description
+        :param bounds: upper bounds of the buckets in the observed unit (e.g. us), ascending; +Inf is added
+        :param divisor: observed units per exposed unit (e.g. 1000000 for us -> s)
+        """
+        self.name = name
+        self.help = help
+        self.bounds = array.array('i', bounds)
+        self.divisor = divisor
+        self._labels = tuple(f'{name}_bucket{{le="{bound / divisor}"}} ' for bound in bounds)
+        self.counts = array.array('I', [0] * (len(bounds) + 1))
+        self.sum = 0
+
+    def observe(self, value: int) -> None:
+        bounds = self.bounds
+        i = 0
+        n = len(bounds)
+        while i < n and value > bounds[i]:
+            i += 1
+        self.counts[i] += 1
+        self.sum += value
+
+    @property
+    def count(self) -> int:
+        return sum(self.counts)
+
+    def expose(self, out: list) -> None:
+        name = self.name
+        out.append(f"# TYPE {name} histogram\n# HELP {name} {self.help}\n")
+        cumulative = 0
+        for label, count in zip(self._labels, self.counts):
+            cumulative += count
+            out.append(f"{label}{cumulative}\n")
+        cumulative += self.counts[-1]
+        out.append(f'{name}_bucket{{le="+Inf"}} {cumulative}\n{name}_count {cumulative}\n'
+                   f'{name}_sum {self.sum / self.divisor}\n')
+
+
+class Registry:
+    CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+    def __init__(self):
+        """
+        Metrics of the clock, exposed in the OpenMetrics text format.
+        """
+        self._metrics = {}
+
+    def register(self, metric):
+        if metric.name in self._metrics:
+            raise ValueError(f"duplicate metric: {metric.name}")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def __getitem__(self, name: str):
+        return self._metrics[name]
+
+    def expose(self) -> str:
+        out = []
+        for metric in self._metrics.values():
+            metric.expose(out)
+        out.append("# EOF\n")
+        return "".join(out)
+
+
+REGISTRY = Registry()
+
+# latency buckets (us)
+LATENCY_US = (100, 250, 500, 1000, 2500, 5000, 10000, 25000, 50000, 100000, 250000, 500000, 1000000)
+
+
+def counter(name: str, help: str) -> Counter:
+    return REGISTRY.register(Counter(name, help))
+
+
+def gauge(name: str, help: str, fn=None) -> Gauge:
+    return REGISTRY.register(Gauge(name, help, fn))
+
+
+def histogram(name: str, help: str, bounds: tuple = LATENCY_US, divisor: int = 1000000) -> Histogram:
+    return REGISTRY.register(Histogram(name, help, bounds, divisor))
+
+
+gauge("gc_free_bytes", "Free heap.", lambda: gc.mem_free())
+gauge("gc_alloc_bytes", "Allocated heap.", lambda: gc.mem_alloc())
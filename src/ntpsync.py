@@ -1,5 +1,5 @@
+import array
 import asyncio
-import json
 import struct
 import sys
 import time
@@ -7,90 +7,333 @@ import time
 import usocket as socket
 from machine import RTC
 
+import metrics
+import trace
+from config import store
+
+_syncs = metrics.counter("ntp_syncs", "Successful NTP syncs.")
+_failures = metrics.counter("ntp_failures", "NTP syncs without a valid answer.")
+_rtt = metrics.histogram("ntp_rtt_seconds", "Round-trip delay of the best NTP answer.")
+_offset = metrics.histogram("ntp_offset_seconds", "Absolute clock offset measured by NTP.",
+                            metrics.LATENCY_US + (10000000, 100000000))
+
 
 class NTPSync:
     _NTP_CONFIG = "ntp.json"
-    # Sommerzeiten: 2021 bis 2037
-    _dst_ranges = [(1616893200, 1635645600), (1648342800, 1667095200), (1679792400, 1698544800),
-                   (1711846800, 1729994400), (1743296400, 1761444000), (1774746000, 1792893600),
-                   (1806195600, 1824948000), (1837645200, 1856397600), (1869094800, 1887847200),
-                   (1901149200, 1919296800), (1932598800, 1950746400), (1964048400, 1982800800),
-                   (1995498000, 2014250400), (2026947600, 2045700000), (2058397200, 2077149600),
-                   (2090451600, 2108599200), (2121901200, 2140048800)]
 
     @staticmethod
-    # Funktion: Lokale Zeit mit Zeitumstellung ausgeben
-    def localTime(tz_offset):
-        dst_adjust = 0
-        utc = time.time()
-        # Prüfen ob Sommerzeit ist
-        if any(lwr <= utc < upr for (lwr, upr) in NTPSync._dst_ranges): dst_adjust = 3600
-        # Lokale Zeit ermitteln
-        lt = time.gmtime(utc + (tz_offset * 3600) + dst_adjust)
-        return (lt[0], lt[1], lt[2], lt[6], lt[3], lt[4], lt[5], 0)
-
-    @staticmethod
-    def getntptime(ntp_host: str) -> tuple[int, int, int, int, int, int, int, int]:
+    def _ntp_delta() -> int:
         EPOCH_YEAR = time.gmtime(0)[0]
         if EPOCH_YEAR == 2000:
-            NTP_DELTA = 3155673600  # (date(2000, 1, 1) - date(1900, 1, 1)).days * 24*60*60
+            return 3155673600  # (date(2000, 1, 1) - date(1900, 1, 1)).days * 24*60*60
         elif EPOCH_YEAR == 1970:
-            NTP_DELTA = 2208988800  # (date(1970, 1, 1) - date(1900, 1, 1)).days * 24*60*60
+            return 2208988800  # (date(1970, 1, 1) - date(1900, 1, 1)).days * 24*60*60
         else:
             raise Exception("Unsupported epoch: {}".format(EPOCH_YEAR))
 
-        ntp_query = bytearray(48)
-        ntp_query[0] = 0x1B
-        addr = socket.getaddrinfo(ntp_host, 123)[0][-1]
-        s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    @staticmethod
+    def _to_ns(msg: bytes, offset: int, ntp_delta: int) -> int:
+        # NTP timestamp (seconds since 1900 and 32 bit fraction) -> ns since epoch
+        sec, frac = struct.unpack("!II", msg[offset:offset + 8])
+        return (sec - ntp_delta) * 1000000000 + (frac * 1000000000 >> 32)
+
+    @staticmethod
+    def _address(host: str) -> tuple:
+        host, _, port = host.partition(':')
+        return socket.getaddrinfo(host, int(port) if port else 123)[0][-1]
+
+    @trace.traced("query", "ntp")
+    async def query(self, timeout_ms: int = 1000) -> tuple[int, int, str] | None:
+        """
+        Query all servers concurrently and return the sample with the smallest round-trip delay.
+
+        :param timeout_ms: time to wait for the answers
+        :return: (offset, delay, host) in ns, None if no server answered properly
+        """
+        ntp_delta = self._ntp_delta()
+        pending = []
         try:
-            s.settimeout(1)
-            res = s.sendto(ntp_query, addr)
-            msg = s.recv(48)
-            rt = time.gmtime(struct.unpack("!I", msg[40:44])[0] - NTP_DELTA)
-        except:
-            rt = (0, 0, 0, 0, 0, 0, 0)
+            for host in self.hosts:
+                try:
+                    # getaddrinfo blocks, resolve a host only until it fails to answer properly (pool hosts
+                    # resolve to another server then)
+                    if host not in self._addresses:
+                        self._addresses[host] = self._address(host)
+                    s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+                    s.setblocking(False)
+                    pending.append((s, host))
+
+                    ntp_query = bytearray(48)
+                    ntp_query[0] = 0x23  # LI 0, version 4, mode 3 (client)
+                    t1 = time.time_ns()
+                    sec = t1 // 1000000000
+                    struct.pack_into("!II", ntp_query, 40, sec + ntp_delta,
+                                     ((t1 - sec * 1000000000) << 32) // 1000000000)
+                    s.sendto(ntp_query, self._addresses[host])
+                    self._sent[host] = (t1, bytes(ntp_query[40:48]))
+                except OSError as e:
+                    print(f"NTP {host}: {e}")
+                    self._addresses.pop(host, None)
+
+            best = None
+            start = time.ticks_ms()
+            while pending and time.ticks_diff(time.ticks_ms(), start) < timeout_ms:
+                for s, host in pending:
+                    try:
+                        msg = s.recv(48)
+                    except OSError:
+                        continue
+                    t4 = time.time_ns()
+                    pending.remove((s, host))
+                    s.close()
+                    sample = self._sample(msg, host, t4, ntp_delta)
+                    if sample is None:
+                        self._addresses.pop(host, None)
+                    elif best is None or sample[1] < best[1]:
+                        best = sample
+                    break
+                else:
+                    await asyncio.sleep_ms(5)
+            return best
         finally:
-            s.close()
-        return (rt[0], rt[1], rt[2], rt[6], rt[3], rt[4], rt[5], 0)
+            # no answer in time
+            for s, host in pending:
+                s.close()
+                self._addresses.pop(host, None)
+
+    def _sample(self, msg: bytes, host: str, t4: int, ntp_delta: int) -> tuple[int, int, str] | None:
+        """
+        Validate an answer and compute clock offset and round-trip delay from its four timestamps.
+        """
+        t1, origin = self._sent[host]
+        if len(msg) < 48 or msg[0] & 7 != 4 or msg[0] >> 6 == 3 or not 1 <= msg[1] <= 15 or msg[24:32] != origin:
+            print(f"NTP {host}: invalid answer")
+            return None
+        t2 = self._to_ns(msg, 32, ntp_delta)
+        t3 = self._to_ns(msg, 40, ntp_delta)
+        offset = ((t2 - t1) + (t3 - t4)) // 2
+        delay = (t4 - t1) - (t3 - t2)
+        return offset, delay, host
+
+    # max rate of the software correction (ppm): time never goes backwards and a minute is never skipped
+    _SLEW_PPM = 500
+    # the drift estimate is clamped to the tolerance of any sane crystal (ppm)
+    _MAX_DRIFT_PPM = 500
+    # samples needed to span this long (s) before they are used to estimate the drift
+    _DRIFT_SPAN = 600
+    # number of syncs kept in the offset history
+    _HISTORY = 16
 
     def __init__(self):
         self._config = None
+        self._callbacks = []
+        self._addresses = {}
+        self._sent = {}
+        self.offset = None
+        self.delay = None
         self.load()
 
+        # software correction added to the RTC: slews from <_slew_from> to <_slew_to> (ns) since <_slew_ts> (RTC ns),
+        # and follows the drift in the meantime
+        self._slew_ts = 0
+        self._slew_from = 0
+        self._slew_to = 0
+        self._drift_ppb = 0
+        # sum of the steps of the RTC (ns), the offset plus this is the offset of the free running crystal
+        self._stepped = 0
+        self._synced = False
+        self._interval = self.min_period
+
+        # offset history: UTC (s), offset of the corrected time (us), offset of the free running crystal (us)
+        self._history_ts = array.array('q', [0] * self._HISTORY)
+        self._history_offset = array.array('q', [0] * self._HISTORY)
+        self._history_free = array.array('q', [0] * self._HISTORY)
+        self._history_next = 0
+        self._history_count = 0
+
+    def subscribe(self, callback) -> None:
+        """
+        Call callback(datetime) after every successful sync.
+        """
+        self._callbacks.append(callback)
+
     def load(self):
-        with open(self._NTP_CONFIG) as f:
-            config = json.load(f)
-            self._config = {"sync_period": int(config["sync_period"]),
-                            "host": str(config["host"])}
+        config = store.get(self._NTP_CONFIG)
+        self._config = {"min_period": int(config.get("min_period", 64)),
+                        "max_period": int(config.get("max_period", config.get("sync_period", 1800))),
+                        "step_ms": int(config.get("step_ms", 128)),
+                        "hosts": [str(host) for host in config.get("hosts", [config.get("host")])]}
 
     def save(self):
-        config = {"sync_period": self._config["sync_period"],
-                  "host": self._config["host"]}
-        with open(self._NTP_CONFIG, "w") as f:
-            json.dump(config)
+        config = {"min_period": self._config["min_period"],
+                  "max_period": self._config["max_period"],
+                  "step_ms": self._config["step_ms"],
+                  "hosts": self._config["hosts"]}
+        store.set(self._NTP_CONFIG, config)
 
     @property
-    def sync_period(self):
-        return self._config['sync_period']
+    def min_period(self):
+        return self._config['min_period']
 
     @property
-    def host(self):
-        return self._config['host']
+    def max_period(self):
+        return self._config['max_period']
+
+    @property
+    def step_ms(self):
+        """
+        Offsets above this are corrected by setting the RTC, below by slewing.
+        """
+        return self._config['step_ms']
+
+    @property
+    def hosts(self):
+        return self._config['hosts']
+
+    @property
+    def interval(self) -> int:
+        """
+        Current sync interval (s), between min_period and max_period.
+        """
+        return self._interval
+
+    @property
+    def drift(self) -> float:
+        """
+        Estimated drift of the RTC (ppm), positive if it runs slow.
+        """
+        return self._drift_ppb / 1000
+
+    @property
+    def history(self) -> list[tuple[int, int]]:
+        """
+        (UTC, offset in us) of the last syncs, oldest first. The offset is the error of the corrected time before the
+        sync.
+        """
+        n = self._history_count
+        idx = [(self._history_next - n + i) % self._HISTORY for i in range(n)]
+        return [(self._history_ts[i], self._history_offset[i]) for i in idx]
+
+    def _correction(self, now: int) -> int:
+        """
+        Software correction (ns) of the RTC at RTC time <now> (ns).
+        """
+        elapsed = now - self._slew_ts
+        max_slew = elapsed * self._SLEW_PPM // 1000000
+        return (self._slew_from + elapsed * self._drift_ppb // 1000000000 +
+                max(-max_slew, min(max_slew, self._slew_to - self._slew_from)))
+
+    def time_ns(self) -> int:
+        """
+        Corrected time (ns since epoch).
+        """
+        now = time.time_ns()
+        return now + self._correction(now)
+
+    def time(self) -> int:
+        """
+        Corrected time (s since epoch), use it instead of time.time().
+        """
+        return self.time_ns() // 1000000000
+
+    def _record(self, utc: int, error: int, free: int) -> None:
+        """
+        Add a sync to the history and estimate the drift by a least squares fit of the free running offsets.
+        """
+        i = self._history_next
+        self._history_ts[i] = utc
+        self._history_offset[i] = error // 1000
+        self._history_free[i] = free // 1000
+        self._history_next = (i + 1) % self._HISTORY
+        self._history_count = min(self._history_count + 1, self._HISTORY)
+
+        n = self._history_count
+        if n < 2:
+            return
+        idx = [(self._history_next - n + i) % self._HISTORY for i in range(n)]
+        t0 = self._history_ts[idx[0]]
+        f0 = self._history_free[idx[0]]
+        if utc - t0 < self._DRIFT_SPAN:
+            return
+        # integer fit in s and us: the slope is in ppm, scaled to ppb
+        sx = sy = sxx = sxy = 0
+        for i in idx:
+            x = self._history_ts[i] - t0
+            y = self._history_free[i] - f0
+            sx += x
+            sy += y
+            sxx += x * x
+            sxy += x * y
+        d = n * sxx - sx * sx
+        if d > 0:
+            drift = (n * sxy - sx * sy) * 1000 // d
+            self._drift_ppb = max(-self._MAX_DRIFT_PPM * 1000, min(self._MAX_DRIFT_PPM * 1000, drift))
+
+    async def _step(self, offset: int) -> tuple:
+        """
+        Set the RTC, it can't be set below a second, so set it at the next second boundary.
+        """
+        now = time.time_ns() + offset
+        await asyncio.sleep_ms(1000 - now % 1000000000 // 1000000)
+        rt = time.gmtime(now // 1000000000 + 1)
+        tm = (rt[0], rt[1], rt[2], rt[6], rt[3], rt[4], rt[5], 0)
+        RTC().datetime(tm)
+        self._stepped += offset
+        self._slew_ts = time.time_ns()
+        self._slew_from = self._slew_to = 0
+        return tm
+
+    def _slew(self, now: int, offset: int) -> tuple:
+        """
+        Correct the offset gradually, at most at _SLEW_PPM.
+        """
+        self._slew_from = self._correction(now)
+        self._slew_to = offset
+        self._slew_ts = now
+        rt = time.gmtime((now + self._slew_from) // 1000000000)
+        return rt[0], rt[1], rt[2], rt[6], rt[3], rt[4], rt[5], 0
 
     async def start_sync(self):
         try:
             while True:
                 try:
                     print("NTP sync...", end='')
-                    tm = self.getntptime(self.host)
-                    RTC().datetime((tm[0], tm[1], tm[2], tm[3], tm[4], tm[5], tm[7], 0))
-                    print(f"OK {tm}")
+                    sample = await self.query()
+                    if sample is None:
+                        print("failed")
+                        _failures.inc()
+                        self._interval = self.min_period
+                    else:
+                        self.offset, self.delay, host = sample
+                        _syncs.inc()
+                        _rtt.observe(self.delay // 1000)
+                        _offset.observe(abs(self.offset) // 1000)
+                        now = time.time_ns()
+                        error = self.offset - self._correction(now)
+                        self._record((now + self.offset) // 1000000000, error, self.offset + self._stepped)
+                        if not self._synced or abs(error) > self.step_ms * 1000000:
+                            tm = await self._step(self.offset)
+                            self._synced = True
+                            self._interval = self.min_period
+                            action = "set"
+                        else:
+                            tm = self._slew(now, self.offset)
+                            # sync less often while the corrected time stays well within the step threshold
+                            if abs(error) * 4 < self.step_ms * 1000000:
+                                self._interval = min(self._interval * 2, self.max_period)
+                            else:
+                                self._interval = max(self._interval // 2, self.min_period)
+                            action = "slewing"
+                        print(f"OK {tm} from {host}, offset {self.offset // 1000000}ms ({action}), error "
+                              f"{error // 1000000}ms, delay {self.delay // 1000000}ms, drift {self.drift}ppm, "
+                              f"next in {self._interval}s")
+                        for callback in self._callbacks:
+                            callback(tm)
                 except asyncio.CancelledError:
                     raise
                 except Exception as e:
                     sys.print_exception(e)
 
-                await asyncio.sleep(self.sync_period)
+                await asyncio.sleep(self._interval)
         except asyncio.CancelledError:
             pass
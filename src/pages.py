@@ -0,0 +1,36 @@
+import random
+import time
+
+from microdot import Request
+from microdot.utemplate import Template
+
+# rendered pages by template: (state version, time.time() rendered, page), the boot id keeps ETags from an earlier
+# boot from matching
+_BOOT = random.getrandbits(24)
+_pages = {}
+
+
+async def render_cached(request: Request, template: str, content_type: str, version: tuple, args: tuple,
+                        max_age: int = 0):
+    """
+    Render a template, unless the state it shows is unchanged since the last render. Clients holding the current
+    version get 304 without rendering.
+
+    :param version: version of the state shown, changes whenever the page would
+    :param args: arguments of the template
+    :param max_age: serve the last page for this long (s), even if the state changed
+    """
+    page = _pages.get(template)
+    # ticks would wrap for pages not rendered for days, time() may step back on a sync: such a page is stale
+    if page is not None and 0 <= time.time() - page[1] < max_age:
+        version = page[0]
+    etag = f'"{_BOOT:x}-{"-".join(str(v) for v in version)}"'
+    headers = {'ETag': etag, 'Cache-Control': f'max-age={max_age}' if max_age else 'no-cache'}
+    if request.headers.get('If-None-Match') == etag:
+        return '', 304, headers
+
+    if page is None or page[0] != version:
+        page = (version, time.time(), await Template(template).render_async(*args))
+        _pages[template] = page
+    headers['Content-Type'] = content_type
+    return page[2], headers
@@ -0,0 +1,164 @@
+import array
+import asyncio
+import sys
+import time
+
+import machine
+
+from ldr import LDR
+
+
+class History:
+    def __init__(self, period: int, length: int):
+        """
+        Ring buffers of the min/max/mean of a value over consecutive periods.
+
+        :param period: length of a period (s)
+        :param length: number of periods kept
+        """
+        self.period = period
+        self._min = array.array('f', [0] * length)
+        self._max = array.array('f', [0] * length)
+        self._mean = array.array('f', [0] * length)
+        self._next = 0
+        self._count = 0
+
+        # current period
+        self._slot = None
+        self._acc_min = 0.0
+        self._acc_max = 0.0
+        self._acc_sum = 0.0
+        self._acc_n = 0
+
+    def add(self, ts: int, value: float) -> None:
+        """
+        Add a sample taken at <ts> (s), the current period is stored once a sample of the next period arrives.
+        """
+        slot = ts // self.period
+        if slot != self._slot:
+            self._commit()
+            self._slot = slot
+        if self._acc_n == 0:
+            self._acc_min = self._acc_max = value
+        elif value < self._acc_min:
+            self._acc_min = value
+        elif value > self._acc_max:
+            self._acc_max = value
+        self._acc_sum += value
+        self._acc_n += 1
+
+    def _commit(self) -> None:
+        if self._acc_n == 0:
+            return
+        i = self._next
+        self._min[i] = self._acc_min
+        self._max[i] = self._acc_max
+        self._mean[i] = self._acc_sum / self._acc_n
+        self._next = (i + 1) % len(self._mean)
+        self._count = min(self._count + 1, len(self._mean))
+        self._acc_sum = 0.0
+        self._acc_n = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def slice(self, n: int | None = None) -> tuple[list[float], list[float], list[float]]:
+        """
+        Min, max and mean of the last <n> (all if None) stored periods, oldest first.
+        """
+        if n is None or n > self._count:
+            n = self._count
+        length = len(self._mean)
+        idx = [(self._next - n + i) % length for i in range(n)]
+        return [self._min[i] for i in idx], [self._max[i] for i in idx], [self._mean[i] for i in idx]
+
+
+class SensorHub:
+    # (period in s, number of periods) of the history tiers: 1s for 10min, 1min for 24h
+    TIERS = ((1, 600), (60, 1440))
+
+    def __init__(self, ldr: LDR, btmp_adcpin: int = 4, tiers: tuple = TIERS):
+        """
+        Samples the sensors in the background and keeps their history, so readers never touch the hardware.
+        Each sensor uses 12 bytes per period of each tier.
+
+        :param ldr: LDR measuring the ambient light
+        :param btmp_adcpin: ADC of the board temperature sensor
+        :param tiers: (period, length) of the history tiers
+        """
+        self._ldr = ldr
+        self._btmp_sensor = machine.ADC(btmp_adcpin)
+        self._history = {name: [History(period, length) for period, length in tiers]
+                         for name in ("temperature", "charge")}
+        self._temperature = self._read_temperature()
+        # changes whenever a sampled value changes
+        self._version = 0
+        self._sampled = None
+
+    def _read_temperature(self) -> float:
+        adc_value = self._btmp_sensor.read_u16()
+        volt = (3.3 / 65535) * adc_value
+        temperature = 27 - (volt - 0.706) / 0.001721
+        return round(temperature, 1)
+
+    async def start(self, period: int = 1):
+        try:
+            while True:
+                try:
+                    ts = time.time()
+                    self._temperature = self._read_temperature()
+                    for history in self._history["temperature"]:
+                        history.add(ts, self._temperature)
+                    if self._ldr.charge is not None:
+                        for history in self._history["charge"]:
+                            history.add(ts, self._ldr.charge)
+                    sampled = (self._temperature, self._ldr.charge)
+                    if sampled != self._sampled:
+                        self._sampled = sampled
+                        self._version += 1
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    sys.print_exception(e)
+
+                await asyncio.sleep(period)
+        except asyncio.CancelledError:
+            pass
+
+    @property
+    def temperature(self) -> float:
+        """
+        Board temperature (°C) of the last sample.
+        """
+        return self._temperature
+
+    @property
+    def charge(self) -> int | None:
+        """
+        LDR charge time (us) of the last measurement.
+        """
+        return self._ldr.charge
+
+    @property
+    def version(self) -> int:
+        """
+        Incremented whenever the temperature or the charge changes, e.g. to tell if a rendered page is stale.
+        """
+        return self._version
+
+    @property
+    def sensors(self) -> tuple:
+        return tuple(self._history)
+
+    @property
+    def tiers(self) -> int:
+        """
+        Number of history tiers.
+        """
+        return len(self._history["temperature"])
+
+    def history(self, sensor: str, tier: int = 0) -> History:
+        """
+        History of a sensor at a resolution tier (0: finest).
+        """
+        return self._history[sensor][tier]
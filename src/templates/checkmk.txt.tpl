@@ -1,4 +1,9 @@
 {% args wclock, ldr, boardttemp %}<<<local>>>
 P "board" temp={{ boardttemp }};40;57;; RPi Pico 2w board temperature
 P "WClock" fg_b={{ wclock.brightness[0] }};;;0;255|bg_b={{ wclock.brightness[1] }};;;0;255 WClock properties
+P "WClock frames" sent={{ wclock.frames[0] }}|skipped={{ wclock.frames[1] }} WClock frames sent/skipped
+P "WClock frame cache" hits={{ wclock.frame_cache_stats[0] }}|misses={{ wclock.frame_cache_stats[1] }}|evictions={{ wclock.frame_cache_stats[2] }} WClock frame cache
+P "WClock scheduler" wakeups={{ wclock.scheduler_stats[0] }}|renders={{ wclock.scheduler_stats[1] }} WClock display task
+P "WClock animation" fps={{ wclock.animation_stats[0] }}|dropped={{ wclock.animation_stats[1] }}|worst_late_ms={{ wclock.animation_stats[2] }} WClock last animation
+P "WClock crossfade" fps={{ wclock.fade_stats[0] }}|frames={{ wclock.fade_stats[1] }}|misses={{ wclock.fade_stats[2] }} WClock crossfade
 P "LRD" charging={{ ldr.charge }} LDR (us)
\ No newline at end of file
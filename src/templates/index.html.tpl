@@ -7,6 +7,56 @@
 </head>
 <body>
 
+<h2>Display</h2>
+<canvas id="display" width="330" height="330" style="background: black"></canvas>
+<script>
+    // live frames of /framebuffer: layout (json), then keyframes "K" and deltas "D" of packed led values
+    const canvas = document.getElementById("display");
+    const ctx = canvas.getContext("2d");
+    const size = 11;
+    const cell = canvas.width / size;
+    let layout = null;
+
+    function led(pos, value) {
+        // strip is wired in a serpentine from the lower right corner
+        const y = size - 1 - Math.floor(pos / size);
+        const x = y % 2 === 0 ? size - 1 - pos % size : pos % size;
+        const [r, g, b] = layout.shift.slice(0, 3).map(shift => (value >>> shift) & 255);
+        ctx.fillStyle = `rgb(${r}, ${g}, ${b})`;
+        ctx.beginPath();
+        ctx.arc((x + 0.5) * cell, (y + 0.5) * cell, cell * 0.4, 0, 2 * Math.PI);
+        ctx.fill();
+    }
+
+    function value(data, offset) {
+        let v = 0;
+        for (let i = layout.bytes - 1; i >= 0; i--) {
+            v = v * 256 + data[offset + i];
+        }
+        return v;
+    }
+
+    const ws = new WebSocket(`ws://${location.host}/framebuffer`);
+    ws.binaryType = "arraybuffer";
+    ws.onmessage = (event) => {
+        if (typeof event.data === "string") {
+            layout = JSON.parse(event.data);
+            return;
+        }
+        const data = new Uint8Array(event.data);
+        const type = String.fromCharCode(data[0]);
+        if (type === "K") {
+            for (let i = 0; i < layout.num_leds; i++) {
+                led(i, value(data, 1 + layout.bytes * i));
+            }
+        } else if (type === "D") {
+            for (let p = 1; p < data.length; p += layout.bytes + 1) {
+                led(data[p], value(data, p + 1));
+            }
+        }
+    };
+</script>
+
 <h2>WiFi</h2>
 <a href="/wifi/">Setup SSID...</a><br/>
 
@@ -21,8 +71,8 @@
 <h2>WClock</h2>
 <table border="1">
     <tr>
-        <td>timezone offset</td>
-        <td>{{ wclock.tz_offset }}h</td>
+        <td>timezone</td>
+        <td>{{ wclock.tz }} ({{ wclock.tz_offset // 60 }}min)</td>
     </tr>
     <tr>
         <td>refresh period</td>
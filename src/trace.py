@@ -0,0 +1,110 @@
+import array
+import time
+
+# spans are recorded only while enabled, see enable()
+enabled = False
+
+# ring of the last _SIZE spans: id of the span, start (ticks_us) and duration (us)
+_SIZE = 512
+_ids = array.array('H', [0] * _SIZE)
+_starts = array.array('i', [0] * _SIZE)
+_durations = array.array('i', [0] * _SIZE)
+_next = 0
+_count = 0
+
+# registered spans by id
+_spans = []
+
+
+class Span:
+    def __init__(self, name: str, category: str):
+        """
+        Named span recorded by `with span:`. Create spans once (e.g. at module level), entering one while tracing is
+        disabled costs a flag check. A span instance must not be entered while it is open, e.g. by two tasks at once.
+
+        :param name: name of the span
+        :param category: subsystem, spans of a category are shown on the same track
+        """
+        self.name = name
+        self.category = category
+        self.id = len(_spans)
+        self._start = None
+        _spans.append(self)
+
+    def __enter__(self):
+        if enabled:
+            self._start = time.ticks_us()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if self._start is not None:
+            self.record(self._start)
+            self._start = None
+        return False
+
+    def record(self, start: int) -> None:
+        """
+        Record the span from <start> (ticks_us) until now.
+        """
+        global _next, _count
+        i = _next
+        _ids[i] = self.id
+        _starts[i] = start
+        _durations[i] = time.ticks_diff(time.ticks_us(), start)
+        _next = (i + 1) % _SIZE
+        if _count < _SIZE:
+            _count += 1
+
+
+def traced(name: str, category: str):
+    """
+    Decorator recording each call of an async function as a span, concurrent calls are fine. The wrapper adds a
+    coroutine per call even while tracing is disabled: for functions called per frame, enter a Span instead.
+    """
+    def decorator(f):
+        span = Span(name, category)
+
+        async def wrapper(*args, **kwargs):
+            if not enabled:
+                return await f(*args, **kwargs)
+            start = time.ticks_us()
+            try:
+                return await f(*args, **kwargs)
+            finally:
+                span.record(start)
+
+        return wrapper
+
+    return decorator
+
+
+def enable(on: bool = True) -> None:
+    """
+    Switch tracing on (clearing the recorded spans) or off.
+    """
+    global enabled, _next, _count
+    if on and not enabled:
+        _next = 0
+        _count = 0
+    enabled = on
+
+
+def chrome_trace() -> dict:
+    """
+    Recorded spans in the Chrome trace event format, opens in chrome://tracing or ui.perfetto.dev. Timestamps are
+    relative to the oldest span, ticks_us wraps, so spans should not be older than a few minutes.
+    """
+    idx = [(_next - _count + i) % _SIZE for i in range(_count)]
+    categories = []
+    events = []
+    first = _starts[idx[0]] if idx else 0
+    for i in idx:
+        span = _spans[_ids[i]]
+        if span.category not in categories:
+            categories.append(span.category)
+        events.append({"name": span.name, "cat": span.category, "ph": "X", "pid": 0,
+                       "tid": categories.index(span.category), "ts": time.ticks_diff(_starts[i], first),
+                       "dur": _durations[i]})
+    for tid, category in enumerate(categories):
+        events.append({"name": "thread_name", "ph": "M", "pid": 0, "tid": tid, "args": {"name": category}})
+    return {"traceEvents": events, "displayTimeUnit": "ms"}
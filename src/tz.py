@@ -0,0 +1,208 @@
+import time
+
+# utc of time.time() at 1970-01-01 (the epoch of MicroPython ports is either 1970 or 2000)
+_EPOCH = 0 if time.gmtime(0)[0] == 1970 else -946684800
+# "never" for the cache bounds
+_NEVER = 1 << 62
+
+
+def _days(year: int, month: int, day: int) -> int:
+    """
+    Days since 1970-01-01 of a date (proleptic Gregorian calendar).
+    """
+    year -= month <= 2
+    era = year // 400
+    yoe = year - era * 400
+    doy = (153 * (month + (-3 if month > 2 else 9)) + 2) // 5 + day - 1
+    doe = yoe * 365 + yoe // 4 - yoe // 100 + doy
+    return era * 146097 + doe - 719468
+
+
+def _leap(year: int) -> bool:
+    return year % 4 == 0 and (year % 100 != 0 or year % 400 == 0)
+
+
+class TZ:
+    """
+    Time zone of a POSIX TZ string, e.g. "CET-1CEST,M3.5.0,M10.5.0/3". Transitions are computed from the rules on the
+    fly. The offset is cached together with the span it is valid for, so the common case is one compare.
+    """
+
+    def __init__(self, tz: str):
+        self.tz = tz
+        self._pos = 0
+        self.std_name = self._name()
+        self.std_offset = -self._time()
+        self.dst_name = None
+        self.dst_offset = self.std_offset
+        self._rules = None
+        if self._pos < len(tz):
+            self.dst_name = self._name()
+            self.dst_offset = self.std_offset + 3600
+            if self._pos < len(tz) and tz[self._pos] != ',':
+                self.dst_offset = -self._time()
+            if self._pos < len(tz):
+                self._expect(',')
+                start = self._rule()
+                self._expect(',')
+                end = self._rule()
+                self._rules = (start, end)
+            else:
+                raise ValueError(f"TZ without DST rules is not supported: {tz}")
+        if self._pos != len(tz):
+            raise ValueError(f"invalid TZ: {tz}")
+
+        # cache: offset valid in [start, until)
+        self._start = 0
+        self._until = 0
+        self._offset = self.std_offset
+
+    # --- parser ---
+
+    def _expect(self, c: str) -> None:
+        if self._pos >= len(self.tz) or self.tz[self._pos] != c:
+            raise ValueError(f"invalid TZ, '{c}' expected at {self._pos}: {self.tz}")
+        self._pos += 1
+
+    def _name(self) -> str:
+        tz = self.tz
+        start = self._pos
+        if start < len(tz) and tz[start] == '<':
+            end = tz.find('>', start)
+            if end < 0:
+                raise ValueError(f"invalid TZ: {tz}")
+            self._pos = end + 1
+            return tz[start + 1:end]
+        while self._pos < len(tz) and tz[self._pos].isalpha():
+            self._pos += 1
+        if self._pos - start < 3:
+            raise ValueError(f"invalid TZ name: {tz}")
+        return tz[start:self._pos]
+
+    def _number(self) -> int:
+        tz = self.tz
+        start = self._pos
+        while self._pos < len(tz) and tz[self._pos].isdigit():
+            self._pos += 1
+        if start == self._pos:
+            raise ValueError(f"invalid TZ, number expected at {start}: {tz}")
+        return int(tz[start:self._pos])
+
+    def _time(self) -> int:
+        """
+        [+-]hh[:mm[:ss]] in seconds.
+        """
+        sign = 1
+        if self._pos < len(self.tz) and self.tz[self._pos] in '+-':
+            sign = -1 if self.tz[self._pos] == '-' else 1
+            self._pos += 1
+        seconds = self._number() * 3600
+        for scale in (60, 1):
+            if self._pos < len(self.tz) and self.tz[self._pos] == ':':
+                self._pos += 1
+                seconds += self._number() * scale
+            else:
+                break
+        return sign * seconds
+
+    def _rule(self) -> tuple:
+        """
+        Mm.w.d, Jn or n, optionally followed by /time: (kind, a, b, c, time of day in seconds).
+        """
+        tz = self.tz
+        if tz[self._pos] == 'M':
+            self._pos += 1
+            month = self._number()
+            self._expect('.')
+            week = self._number()
+            self._expect('.')
+            weekday = self._number()
+            rule = ['M', month, week, weekday]
+        elif tz[self._pos] == 'J':
+            self._pos += 1
+            rule = ['J', self._number(), 0, 0]
+        else:
+            rule = ['D', self._number(), 0, 0]
+        seconds = 7200
+        if self._pos < len(tz) and tz[self._pos] == '/':
+            self._pos += 1
+            seconds = self._time()
+        return rule[0], rule[1], rule[2], rule[3], seconds
+
+    # --- transitions ---
+
+    @staticmethod
+    def _local(year: int, rule: tuple) -> int:
+        """
+        Local time (seconds since 1970, in the offset before the transition) of a rule in a year.
+        """
+        kind, a, b, c, seconds = rule
+        if kind == 'M':
+            # day <c> (0: Sunday) of week <b> (5: last) of month <a>
+            first = _days(year, a, 1)
+            day = first + (c - (first + 4)) % 7 + (b - 1) * 7
+            month_days = _days(year + (a == 12), a % 12 + 1, 1) - first
+            while day - first >= month_days:
+                day -= 7
+        elif kind == 'J':
+            # Julian day 1..365, February 29 is never counted
+            day = _days(year, 1, 1) + a - 1 + (_leap(year) and a >= 60)
+        else:
+            # zero based day of the year, February 29 is counted
+            day = _days(year, 1, 1) + a
+        return day * 86400 + seconds
+
+    def _transitions(self, year: int) -> tuple[int, int]:
+        """
+        UTC (seconds since 1970) of the start and end of DST in a year.
+        """
+        start, end = self._rules
+        return self._local(year, start) - self.std_offset, self._local(year, end) - self.dst_offset
+
+    def _update(self, utc: int) -> None:
+        if self._rules is None:
+            self._start = -_NEVER
+            self._until = _NEVER
+            self._offset = self.std_offset
+            return
+
+        t = utc - _EPOCH
+        year = time.gmtime(utc)[0]
+        # transitions around <utc> in order, with the offset valid after each
+        transitions = []
+        for y in (year - 1, year, year + 1):
+            start, end = self._transitions(y)
+            transitions.append((start, self.dst_offset))
+            transitions.append((end, self.std_offset))
+        transitions.sort()
+
+        for i in range(1, len(transitions)):
+            if transitions[i - 1][0] <= t < transitions[i][0]:
+                self._start = transitions[i - 1][0] + _EPOCH
+                self._until = transitions[i][0] + _EPOCH
+                self._offset = transitions[i - 1][1]
+                return
+        raise ValueError(f"no transition found for {utc}")
+
+    def offset(self, utc: int) -> int:
+        """
+        Offset of local time to UTC (s) at <utc>.
+        """
+        if not self._start <= utc < self._until:
+            self._update(utc)
+        return self._offset
+
+    def next_transition(self, utc: int) -> int:
+        """
+        UTC of the next offset change after <utc>, far in the future if there is none.
+        """
+        if not self._start <= utc < self._until:
+            self._update(utc)
+        return self._until
+
+    def localtime(self, utc: int) -> tuple[int, int, int, int, int, int, int, int]:
+        """
+        Local time at <utc> as (year, month, day, weekday, hours, minutes, seconds, 0).
+        """
+        lt = time.gmtime(utc + self.offset(utc))
+        return (lt[0], lt[1], lt[2], lt[6], lt[3], lt[4], lt[5], 0)
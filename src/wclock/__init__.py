@@ -1,2 +1,4 @@
+from wclock.compositor import Compositor, Layer
 from wclock.neopixel import Neopixel
+from wclock.player import Player
 from wclock.wclock import WClock
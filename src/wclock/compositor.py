@@ -0,0 +1,101 @@
+import array
+
+from .neopixel import Neopixel
+
+
+class Layer:
+    # __slots__ = [
+    #    'name',       # name of the layer
+    #    'pixels',     # array.array('I') of packed pixel values in strip order
+    #    'lit',        # strip positions drawn by a transparent layer (bytes), None for an opaque layer
+    #    'key',        # inputs the layer was rasterized from, re-rasterize only if they change
+    #    'visible',    # bool: is the layer composed
+    # ]
+
+    def __init__(self, name: str, num_leds: int, opaque: bool = False) -> None:
+        """
+        :param name: name of the layer
+        :param num_leds: number of leds on the strip
+        :param opaque: an opaque layer covers every layer below, a transparent one only its <lit> positions
+        """
+        self.name = name
+        self.pixels = array.array("I", [0] * num_leds)
+        self.lit = None if opaque else b''
+        self.key = None
+        self.visible = True
+
+    @property
+    def opaque(self) -> bool:
+        return self.lit is None
+
+    def clear(self) -> None:
+        """
+        Set every pixel to 0 (transparent layers draw nothing afterwards) and forget the inputs.
+        """
+        pixels = self.pixels
+        for i in range(len(pixels)):
+            pixels[i] = 0
+        if self.lit is not None:
+            self.lit = b''
+        self.key = None
+
+    def gradient(self, strip: Neopixel, pixel1: int, pixel2: int, left_rgb_w: tuple, right_rgb_w: tuple,
+                 how_bright: int) -> None:
+        """
+        Rasterize a gradient like Neopixel.set_pixel_line_gradient(), but into the layer.
+        """
+        strip.pack_line_gradient(self.pixels, pixel1, pixel2, left_rgb_w, right_rgb_w, how_bright)
+
+
+class Compositor:
+    """
+    Composes named layers (bottom to top) into the pixels of a strip. Each layer keeps its own packed buffer, which is
+    rasterized by its owner only if its inputs (<Layer.key>) change.
+    """
+
+    def __init__(self, strip: Neopixel) -> None:
+        self._strip = strip
+        self._layers = []
+
+    def add(self, name: str, opaque: bool = False) -> Layer:
+        """
+        Add a layer on top of the existing ones.
+        """
+        layer = Layer(name, self._strip.num_leds, opaque)
+        self._layers.append(layer)
+        return layer
+
+    def __getitem__(self, name: str) -> Layer:
+        for layer in self._layers:
+            if layer.name == name:
+                return layer
+        raise KeyError(name)
+
+    def compose(self) -> None:
+        """
+        Merge the visible layers into the strip in one pass: start from the top most visible opaque layer (everything
+        below is covered), then copy the lit positions of the transparent layers above it.
+        """
+        strip = self._strip
+        strip.normalize()
+        out = strip.pixels
+        layers = self._layers
+        if not layers:
+            return
+
+        first = 0
+        for i in range(len(layers)):
+            if layers[i].visible and layers[i].lit is None:
+                first = i
+        if layers[first].visible and layers[first].lit is None:
+            out[:] = layers[first].pixels
+            first += 1
+        else:
+            strip.clear()
+
+        for i in range(first, len(layers)):
+            layer = layers[i]
+            if layer.visible:
+                pixels = layer.pixels
+                for pos in layer.lit:
+                    out[pos] = pixels[pos]
@@ -0,0 +1,99 @@
+import array
+import asyncio
+import time
+
+from .neopixel import Neopixel
+
+
+class Crossfade:
+    # __slots__ = [
+    #    'strip',      # Neopixel faded on
+    #    'duration',   # duration of a fade (ms)
+    #    'max_fps',    # configured frame rate
+    #    'fps',        # current frame rate, lowered when frames miss their deadline
+    #    'frames',     # frames shown by fades
+    #    'misses',     # frames that missed their deadline
+    #    'source',     # array.array('I') of the frame faded from, in strip order
+    #    'target',     # array.array('I') of the frame faded to, in strip order
+    # ]
+
+    def __init__(self, strip: Neopixel, duration: int, fps: int = 25) -> None:
+        """
+        Blends the last frame sent to the strip into a new one, channel by channel in 8 bit fixed point, straight on
+        the packed buffers.
+
+        :param strip: led strip
+        :param duration: duration of a fade (ms)
+        :param fps: frame rate, halved for later frames whenever a frame misses its deadline, raised again by a
+        quarter of it after each fade without a miss
+        """
+        self.strip = strip
+        self.duration = duration
+        self.max_fps = fps
+        self.fps = fps
+        self.frames = 0
+        self.misses = 0
+        self.source = array.array('I', [0] * strip.num_leds)
+        self.target = array.array('I', [0] * strip.num_leds)
+
+    def _blend(self, weight: int) -> None:
+        """
+        pixels = source * (256 - weight) / 256 + target * weight / 256, for every byte of the packed values.
+        """
+        source = self.source
+        target = self.target
+        pixels = self.strip.pixels
+        rest = 256 - weight
+        rgbw = self.strip.W_in_mode
+        for i in range(len(pixels)):
+            a = source[i]
+            b = target[i]
+            if a == b:
+                pixels[i] = a
+                continue
+            # every byte is a channel, only the lowest one is empty in RGB mode
+            value = ((((a >> 24) & 255) * rest + ((b >> 24) & 255) * weight) >> 8) << 24 | \
+                    ((((a >> 16) & 255) * rest + ((b >> 16) & 255) * weight) >> 8) << 16 | \
+                    ((((a >> 8) & 255) * rest + ((b >> 8) & 255) * weight) >> 8) << 8
+            if rgbw:
+                value |= ((a & 255) * rest + (b & 255) * weight) >> 8
+            pixels[i] = value
+
+    async def fade(self, abort=None) -> None:
+        """
+        Fade from the frame last sent to the frame in the strip's pixels (without rotation), then show the latter.
+        Frames are due on a fixed schedule from the start of the fade, the blend weight follows the time, so a late
+        frame shortens nothing.
+
+        :param abort: if given and abort() returns True, the fade stops without showing the new frame (e.g. something
+        else took over the strip)
+        """
+        strip = self.strip
+        self.source[:] = strip.front
+        self.target[:] = strip.pixels
+        missed = False
+        start = time.ticks_ms()
+        elapsed = 0
+        while elapsed < self.duration:
+            if abort is not None and abort():
+                return
+            period = 1000 // self.fps
+            self._blend(elapsed * 256 // self.duration)
+            await strip.show_async()
+            self.frames += 1
+            spent = time.ticks_diff(time.ticks_ms(), start) - elapsed
+            if spent > period:
+                # over budget: lower the rate rather than holding up the other tasks
+                self.misses += 1
+                missed = True
+                self.fps = max(self.fps // 2, 1)
+                period = 1000 // self.fps
+            wait = period - spent
+            await asyncio.sleep_ms(wait if wait > 0 else 0)
+            elapsed = time.ticks_diff(time.ticks_ms(), start)
+        if not missed:
+            # step back up gradually: doubling a halved rate jumps right back to the one that missed
+            self.fps = min(self.fps + max(self.max_fps // 4, 1), self.max_fps)
+
+        strip.pixels[:] = self.target
+        await strip.show_async()
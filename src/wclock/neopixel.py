@@ -1,9 +1,19 @@
 import array
+import asyncio
 import time
 
 import rp2
 from machine import Pin
 
+import metrics
+import trace
+
+_frames_sent = metrics.counter("neopixel_frames_sent", "Frames sent to the strip.")
+_show_time = metrics.histogram("neopixel_show_seconds", "Time to send and latch a frame.")
+_show = trace.Span("show", "neopixel")
+# entered under the lock of the strip, so never by two calls at once; per frame, so a span rather than @traced
+_show_async = trace.Span("show_async", "neopixel")
+
 
 # PIO state machine for RGB. Pulls 24 bits (rgb -> 3 * 8bit) automatically
 @rp2.asm_pio(sideset_init=rp2.PIO.OUT_LOW, out_shiftdir=rp2.PIO.SHIFT_LEFT, autopull=True, pull_thresh=24)
@@ -56,26 +66,40 @@ slice_maker = slice_maker_class()
 # this, we need to flip the indexes: in 'RGBW', 'R' is on index 0, but we need to shift it left by 3 * 8bits,
 # so in it's inverse, 'WBGR', it has exactly right index. Since micropython doesn't have [::-1] and recursive rev()
 # isn't too efficient we simply do that by XORing (operator ^) each index with 3 (0b11) to make this flip.
-# When dealing with just 'RGB' (3 letter string), this means same but reduced by 1 after XOR!.
+# When dealing with just 'RGB' (3 letter string), the same shifts leave the lowest byte empty: the 24 bit state
+# machine takes the top 3 bytes of each word, so packed values are sent (and DMA'd) as they are.
 # Example: in 'GRBW' we want final form of 0bGGRRBBWW, meaning G with index 0 needs to be shifted 3 * 8bit ->
 # 'G' on index 0: 0b00 ^ 0b11 -> 0b11 (3), just as we wanted.
-# Same hold for every other index (and - 1 at the end for 3 letter strings).
+# Same hold for every other index.
 
 class Neopixel:
+    # number of brightness lookup tables kept at once
+    _MAX_LUTS = 8
+
     # Micropython doesn't implement __slots__, but it's good to have a place
     # to describe the data members...
     # __slots__ = [
     #    'num_leds',   # number of LEDs
-    #    'pixels',     # array.array('I') of raw data for LEDs
+    #    'pixels',     # array.array('I') of raw data for LEDs, rotated by 'offset' (back buffer, drawn into)
+    #    'offset',     # index in 'pixels' of the first led (rotation)
     #    'mode',       # mode 'RGB' etc
     #    'W_in_mode',  # bool: is 'W' in mode
     #    'sm',         # state machine
     #    'shift',      # shift amount for each component, in a tuple for (R,B,G,W)
     #    'delay',      # delay amount
+    #    'latch_ms',   # delay amount in whole milliseconds, used by show_async()
+    #    'lock',       # asyncio.Lock serializing show_async() calls
+    #    'sent',       # asyncio.Event set (and cleared right away) whenever a frame is sent
     #    'brightnessvalue', # brightness scale factor 1..255
+    #    'gamma',      # gamma correction exponent, None for linear
+    #    'luts',       # brightness -> bytes(256) lookup table of scaled (and gamma corrected) channel values
+    #    'front',      # array.array('I') of the last frame sent to the strip, in strip order (front buffer)
+    #    'frames_sent',     # number of frames transmitted by show()
+    #    'frames_skipped',  # number of show() calls skipped, because the frame did not change
+    #    'dma',        # rp2.DMA channel feeding the state machine from 'front', None if not available
     # ]
 
-    def __init__(self, num_leds, state_machine, pin, mode="RGB", delay=0.0003):
+    def __init__(self, num_leds, state_machine, pin, mode="RGB", delay=0.0003, gamma=None):
         """
         Constructor for library class
 
@@ -85,6 +109,7 @@ class Neopixel:
         :param mode: [default: "RGB"] mode and order of bits representing the color value.
         This can be any order of RGB or RGBW (neopixels are usually GRB)
         :param delay: [default: 0.0001] delay used for latching of leds when sending data
+        :param gamma: [default: None] gamma correction exponent applied to each color channel, None for linear
         """
         self.pixels = array.array("I", [0] * num_leds)
         self.mode = mode
@@ -97,12 +122,28 @@ class Neopixel:
                           (mode.index('B') ^ 3) * 8, (mode.index('W') ^ 3) * 8)
         else:
             self.sm = rp2.StateMachine(state_machine, ws2812, freq=8000000, sideset_base=Pin(pin))
-            self.shift = (((mode.index('R') ^ 3) - 1) * 8, ((mode.index('G') ^ 3) - 1) * 8,
-                          ((mode.index('B') ^ 3) - 1) * 8, 0)
+            self.shift = ((mode.index('R') ^ 3) * 8, (mode.index('G') ^ 3) * 8,
+                          (mode.index('B') ^ 3) * 8, 0)
         self.sm.active(1)
         self.num_leds = num_leds
+        self.offset = 0
         self.delay = delay
         self.brightnessvalue = 255
+        self.gamma = gamma
+        self.luts = {}
+        self.front = array.array("I", [0] * num_leds)
+        self.frames_sent = 0
+        self.frames_skipped = 0
+        self.latch_ms = int(delay * 1000) + 1
+        self.lock = asyncio.Lock()
+        self.sent = asyncio.Event()
+        try:
+            self.dma = rp2.DMA()
+            # paced by the TX FIFO DREQ of the state machine: PIO n, state machine k -> n * 8 + k
+            self.dma_ctrl = self.dma.pack_ctrl(size=2, inc_write=False,
+                                               treq_sel=(state_machine // 4) * 8 + state_machine % 4)
+        except (AttributeError, OSError):
+            self.dma = None
 
     def brightness(self, brightness=None):
         """
@@ -132,6 +173,16 @@ class Neopixel:
         :param how_bright: [default: None] Brightness of current interval. If None, use global brightness value
         :return: None
         """
+        self.pack_line_gradient(self.pixels, pixel1, pixel2, left_rgb_w, right_rgb_w, how_bright, self.offset)
+
+    def pack_line_gradient(self, pixels, pixel1, pixel2, left_rgb_w, right_rgb_w, how_bright=None, offset=0):
+        """
+        Pack a gradient like set_pixel_line_gradient() into any buffer of <num_leds> packed values (e.g. a layer)
+
+        :param pixels: array.array('I') written to
+        :param offset: [default: 0] index in <pixels> of the first led (rotation)
+        :return: None
+        """
         if pixel2 - pixel1 == 0:
             return
         right_pixel = max(pixel1, pixel2)
@@ -152,9 +203,10 @@ class Neopixel:
             # if it's (r, g, b, w)
             if with_W:
                 white = round(w_diff * fraction + left_rgb_w[3])
-                self.set_pixel(left_pixel + i, (red, green, blue, white), how_bright)
+                value = self.pack((red, green, blue, white), how_bright)
             else:
-                self.set_pixel(left_pixel + i, (red, green, blue), how_bright)
+                value = self.pack((red, green, blue), how_bright)
+            pixels[(left_pixel + i + offset) % self.num_leds] = value
 
     def set_pixel_line(self, pixel1, pixel2, rgb_w, how_bright=None):
         """
@@ -169,37 +221,72 @@ class Neopixel:
         if pixel2 >= pixel1:
             self.set_pixel(slice_maker[pixel1:pixel2 + 1], rgb_w, how_bright)
 
-    def set_pixel(self, pixel_num, rgb_w, how_bright=None):
+    def pack(self, rgb_w, how_bright=None):
         """
-        Set red, green and blue (+ white) value of pixel on position <pixel_num>
-        pixel_num may be a 'slice' object, and then the operation is applied
-        to all pixels implied by the slice (most useful when called via __setitem__)
+        Pack red, green and blue (+ white) value into the raw pixel format of the strip,
+        so it can be written directly into <pixels>
 
-        :param pixel_num: Index of pixel to be set or slice object representing multiple leds
         :param rgb_w: Tuple of form (r, g, b) or (r, g, b, w) representing color to be used
         :param how_bright: [default: None] Brightness of current interval. If None, use global brightness value
-        :return: None
+        :return: packed pixel value
         """
         if how_bright is None:
             how_bright = self.brightness()
         sh_R, sh_G, sh_B, sh_W = self.shift
-        bratio = how_bright / 255.0
+        lut = self.luts.get(how_bright)
+        if lut is None:
+            lut = self.lut(how_bright)
 
-        red = round(rgb_w[0] * bratio)
-        green = round(rgb_w[1] * bratio)
-        blue = round(rgb_w[2] * bratio)
         white = 0
         # if it's (r, g, b, w)
         if len(rgb_w) == 4 and self.W_in_mode:
-            white = round(rgb_w[3] * bratio)
+            white = lut[rgb_w[3]]
+
+        return white << sh_W | lut[rgb_w[2]] << sh_B | lut[rgb_w[0]] << sh_R | lut[rgb_w[1]] << sh_G
+
+    def lut(self, how_bright):
+        """
+        Build (or return the cached) lookup table, which maps a color channel value 0..255 to its value scaled by
+        brightness and gamma corrected. Only the last few brightness levels are kept.
+
+        :param how_bright: Brightness on interval 0..255
+        :return: bytes of 256 scaled channel values
+        """
+        lut = self.luts.get(how_bright)
+        if lut is None:
+            if len(self.luts) >= self._MAX_LUTS:
+                self.luts.clear()
+            bratio = how_bright / 255.0
+            if self.gamma is None:
+                lut = bytes(round(v * bratio) for v in range(256))
+            else:
+                lut = bytes(round(255 * (v / 255) ** self.gamma * bratio) for v in range(256))
+            self.luts[how_bright] = lut
+        return lut
+
+    def set_pixel(self, pixel_num, rgb_w, how_bright=None):
+        """
+        Set red, green and blue (+ white) value of pixel on position <pixel_num>
+        pixel_num may be a 'slice' object, and then the operation is applied
+        to all pixels implied by the slice (most useful when called via __setitem__)
 
-        pix_value = white << sh_W | blue << sh_B | red << sh_R | green << sh_G
+        :param pixel_num: Index of pixel to be set or slice object representing multiple leds
+        :param rgb_w: Tuple of form (r, g, b) or (r, g, b, w) representing color to be used
+        :param how_bright: [default: None] Brightness of current interval. If None, use global brightness value
+        :return: None
+        """
+        pix_value = self.pack(rgb_w, how_bright)
+        offset = self.offset
         # set some subset, if pixel_num is a slice:
         if type(pixel_num) is slice:
-            for i in range(*pixel_num.indices(self.num_leds)):
-                self.pixels[i] = pix_value
+            if offset == 0:
+                for i in range(*pixel_num.indices(self.num_leds)):
+                    self.pixels[i] = pix_value
+            else:
+                for i in range(*pixel_num.indices(self.num_leds)):
+                    self.pixels[(i + offset) % self.num_leds] = pix_value
         else:
-            self.pixels[pixel_num] = pix_value
+            self.pixels[(pixel_num + offset) % self.num_leds] = pix_value
 
     def get_pixel(self, pixel_num):
         """
@@ -208,7 +295,7 @@ class Neopixel:
         :param pixel_num: Index of pixel to be set
         :return rgb_w: Tuple of form (r, g, b) or (r, g, b, w) representing color to be used
         """
-        balance = self.pixels[pixel_num]
+        balance = self.pixels[(pixel_num + self.offset) % self.num_leds]
         sh_R, sh_G, sh_B, sh_W = self.shift
         if self.W_in_mode:
             w = (balance >> sh_W) & 255
@@ -312,41 +399,149 @@ class Neopixel:
 
     def rotate_left(self, num_of_pixels=None):
         """
-        Rotate <num_of_pixels> pixels to the left
+        Rotate <num_of_pixels> pixels to the left. Only the rotation offset changes, pixel data stays in place.
 
         :param num_of_pixels: Number of pixels to be shifted to the left. If None, it shifts for 1.
         :return: None
         """
         if num_of_pixels is None:
             num_of_pixels = 1
-        self.pixels = self.pixels[num_of_pixels:] + self.pixels[:num_of_pixels]
+        self.offset = (self.offset + num_of_pixels) % self.num_leds
 
     def rotate_right(self, num_of_pixels=None):
         """
-        Rotate <num_of_pixels> pixels to the right
+        Rotate <num_of_pixels> pixels to the right. Only the rotation offset changes, pixel data stays in place.
 
         :param num_of_pixels: Number of pixels to be shifted to the right. If  None, it shifts for 1.
         :return: None
         """
         if num_of_pixels is None:
             num_of_pixels = 1
-        num_of_pixels = -1 * num_of_pixels
-        self.pixels = self.pixels[num_of_pixels:] + self.pixels[:num_of_pixels]
+        self.offset = (self.offset - num_of_pixels) % self.num_leds
+
+    def _reverse(self, left, right):
+        pixels = self.pixels
+        while left < right:
+            pixels[left], pixels[right] = pixels[right], pixels[left]
+            left += 1
+            right -= 1
+
+    def normalize(self):
+        """
+        Apply the rotation offset to the pixel data in place, so <pixels> is in strip order again.
+
+        :return: None
+        """
+        offset = self.offset
+        if offset != 0:
+            self._reverse(0, offset - 1)
+            self._reverse(offset, self.num_leds - 1)
+            self._reverse(0, self.num_leds - 1)
+            self.offset = 0
+
+    def load(self, frame):
+        """
+        Replace all pixels with a frame of packed pixel values in strip order.
 
-    def show(self):
+        :param frame: array.array('I') of <num_leds> packed pixel values
+        :return: None
+        """
+        self.pixels[:] = frame
+        self.offset = 0
+
+    def _unchanged(self):
+        if self.frames_sent == 0:
+            return False
+        front = self.front
+        offset = self.offset
+        if offset == 0:
+            return front == self.pixels
+        pixels = self.pixels
+        n = self.num_leds - offset
+        for i in range(n):
+            if front[i] != pixels[offset + i]:
+                return False
+        for i in range(offset):
+            if front[n + i] != pixels[i]:
+                return False
+        return True
+
+    def _prepare(self, force):
+        """
+        Swap the back buffer to the front, unless the frame did not change.
+        The back buffer keeps the frame afterwards, so drawing can continue on it.
+
+        :param force: swap even if the frame did not change
+        :return: True if the frame needs to be sent
+        """
+        if not force and self._unchanged():
+            self.frames_skipped += 1
+            return False
+
+        offset = self.offset
+        if offset == 0:
+            self.front, self.pixels = self.pixels, self.front
+            self.pixels[:] = self.front
+        else:
+            # bring the rotated back buffer to strip order
+            front = self.front
+            pixels = self.pixels
+            n = self.num_leds - offset
+            for i in range(n):
+                front[i] = pixels[offset + i]
+            for i in range(offset):
+                front[n + i] = pixels[i]
+
+        self.frames_sent += 1
+        _frames_sent.inc()
+        # wake the waiting tasks, they compare frames_sent to tell a new frame
+        self.sent.set()
+        self.sent.clear()
+        return True
+
+    def show(self, force=False):
         """
         Send data to led-strip, making all changes on leds have an effect.
         This method should be used after every method that changes the state of leds or after a chain of changes.
+        If the frame is identical to the last one sent, transmission and latching is skipped.
+
+        :param force: [default: False] send the frame even if it did not change
         :return: None
         """
-        # If mode is RGB, we cut 8 bits of, otherwise we keep all 32
-        cut = 8
-        if self.W_in_mode:
-            cut = 0
-
-        self.sm.put(self.pixels, cut)
+        with _show:
+            start = time.ticks_us()
+            if self._prepare(force):
+                self.sm.put(self.front)
+                time.sleep(self.delay)
+                _show_time.observe(time.ticks_diff(time.ticks_us(), start))
+
+    async def show_async(self, force=False):
+        """
+        Send data to led-strip like show(), but yield to other tasks while the data is transferred and latched.
+        The frame is handed to the DMA, if available, otherwise it is put into the state machine in one go.
 
-        time.sleep(self.delay)
+        :param force: [default: False] send the frame even if it did not change
+        :return: None
+        """
+        async with self.lock:
+            with _show_async:
+                start = time.ticks_us()
+                if not self._prepare(force):
+                    return
+
+                if self.dma is None:
+                    self.sm.put(self.front)
+                else:
+                    self.dma.config(read=self.front, write=self.sm, count=self.num_leds, ctrl=self.dma_ctrl,
+                                    trigger=True)
+                    while self.dma.active():
+                        await asyncio.sleep_ms(1)
+
+                # wait for the FIFO to drain, then for the latch
+                while self.sm.tx_fifo():
+                    await asyncio.sleep_ms(0)
+                await asyncio.sleep_ms(self.latch_ms)
+                _show_time.observe(time.ticks_diff(time.ticks_us(), start))
 
     def fill(self, rgb_w, how_bright=None):
         """
@@ -365,4 +560,7 @@ class Neopixel:
 
         :return: None
         """
-        self.pixels = array.array("I", [0] * self.num_leds)
+        pixels = self.pixels
+        for i in range(self.num_leds):
+            pixels[i] = 0
+        self.offset = 0
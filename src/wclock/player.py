@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+from .neopixel import Neopixel
+
+
+class Player:
+    # __slots__ = [
+    #    'strip',      # Neopixel played on
+    #    'fps',        # target frame rate
+    #    'shown',      # frames shown by the last play()
+    #    'dropped',    # frames skipped by the last play(), because the player was late
+    #    'worst_late', # worst lateness of a shown frame (ms)
+    #    'elapsed',    # duration of the last play() (ms)
+    # ]
+
+    def __init__(self, strip: Neopixel, fps: int = 24) -> None:
+        """
+        Plays frames on a fixed schedule: frame i is due at start + i / fps (ticks_ms), or at its own due time. A late
+        player skips the frames it missed instead of slowing down, so the animation keeps its duration under load.
+
+        :param strip: led strip
+        :param fps: frames per second
+        """
+        self.strip = strip
+        self.fps = fps
+        self.shown = 0
+        self.dropped = 0
+        self.worst_late = 0
+        self.elapsed = 0
+
+    async def play(self, count: int, frame, due=None) -> None:
+        """
+        Play <count> frames, frame(i) puts frame i into the strip. It should be cheap (e.g. load a precompiled
+        buffer or set the rotation offset), any per-pixel work belongs before play().
+
+        :param due: due(i) is the time frame i is due (ms since the start), due(count) is the end of the last frame;
+        every 1 / fps if None
+        """
+        if due is None:
+            period = 1000 / self.fps
+            due = lambda i: int(i * period)
+        strip = self.strip
+        self.shown = 0
+        self.dropped = 0
+        self.worst_late = 0
+        start = time.ticks_ms()
+        i = 0
+        while i < count:
+            now = time.ticks_diff(time.ticks_ms(), start)
+            if now >= due(i + 1):
+                # skip the frames already over
+                self.dropped += 1
+                i += 1
+                continue
+            late = now - due(i)
+            if late > self.worst_late:
+                self.worst_late = late
+            frame(i)
+            await strip.show_async()
+            self.shown += 1
+            i += 1
+            wait = due(i) - time.ticks_diff(time.ticks_ms(), start)
+            await asyncio.sleep_ms(wait if wait > 0 else 0)
+        self.elapsed = time.ticks_diff(time.ticks_ms(), start)
+
+    async def play_frames(self, frames: list, due=None) -> None:
+        """
+        Play precompiled frames: array.array('I') of packed pixel values in strip order.
+
+        :param due: due times of the frames, see play()
+        """
+        strip = self.strip
+        await self.play(len(frames), lambda i: strip.load(frames[i]), due)
+
+    @property
+    def achieved_fps(self) -> float:
+        """
+        Frames shown per second by the last play().
+        """
+        return round(self.shown * 1000 / self.elapsed, 1) if self.elapsed else 0.0
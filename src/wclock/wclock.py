@@ -1,18 +1,31 @@
+import array
 import asyncio
-import json
 import math
+import os
 import random
 import sys
+import time
 
-from machine import Timer
-
+import metrics
+import trace
+from config import store
 from ldr import LDR
-from ntpsync import NTPSync
+from tz import TZ
+from .compositor import Compositor
+from .crossfade import Crossfade
 from .neopixel import Neopixel
+from .player import Player
+
+_frames_rendered = metrics.counter("wclock_frames_rendered", "Frames rendered by the display task.")
+_render_time = metrics.histogram("wclock_render_seconds", "Time to render a frame of the display task, without "
+                                                          "sending it.")
+_tick = trace.Span("tick", "wclock")
 
 
 class WClock:
     _WCLOCK_CONFIG = "wclock.json"
+    # brightness is looked up in buckets of the LDR charge time, log-spaced up to _CHARGE_MAX
+    _CHARGE_MAX = 1000000
 
     @classmethod
     def xy2pos(cls, xy: tuple[int, int]) -> int:
@@ -41,130 +54,192 @@ class WClock:
     _indigo = (100, 0, 90)
     _violet = (200, 0, 100)
 
-    _alphabet = {'A': (4, 3),
-                 'Á': (1, 4),
-                 'B': (0, 10),
-                 'C': (7, 1),
-                 'D': (10, 4),
-                 'E': (7, 0),
-                 'É': (2, 0),
-                 'F': (9, 2),
-                 'G': (8, 0),
-                 'H': (6, 0),
-                 'I': (4, 5),
-                 'Í': (4, 0),
-                 'J': (7, 3),
-                 'K': (1, 0),
-                 'L': (0, 1),
-                 'M': (10, 0),
-                 'N': (0, 2),
-                 'O': (3, 4),
-                 'Ó': (2, 2),
-                 'Ö': (2, 2),
-                 'Ő': (10, 8),
-                 'P': (4, 2),
-                 'Q': (10, 2),
-                 'R': (0, 0),
-                 'S': (2, 6),
-                 'T': (2, 1),
-                 'U': (0, 9),
-                 'Ú': (1, 3),
-                 'Ü': (3, 1),
-                 'Ű': (8, 2),
-                 'V': (3, 3),
-                 'W': (1, 2),
-                 'X': (0, 5),
-                 'Y': (9, 0),
-                 'Z': (5, 0)}
-
-    _w_before = {'EGY': [(7, 0), (8, 0), (9, 0)],
-                 'KÉT': [(1, 0), (2, 0), (3, 0)],
-                 'ÖT': [(1, 1), (2, 1)],
-                 'TÍZ': [(3, 0), (4, 0), (5, 0)]
-                 }
-
-    _w_unit = {'PERC MÚLVA': [(4, 1), (5, 1), (6, 1), (7, 1), (0, 3), (1, 3), (2, 3), (3, 3), (4, 3)],
-               'PERCCEL MÚLT': [(4, 1), (5, 1), (6, 1), (7, 1), (8, 1), (9, 1), (10, 1), (3, 2), (4, 2), (5, 2),
-                                (6, 2)]}
-
-    _w_part = {'NEGYED': [(5, 4), (6, 4), (7, 4), (8, 4), (9, 4), (10, 4)],
-               'FÉL': [(8, 3), (9, 3), (10, 3)],
-               'HÁROMNEGYED': [(0, 4), (1, 4), (2, 4), (3, 4), (4, 4), (5, 4), (6, 4), (7, 4), (8, 4), (9, 4), (10, 4)]}
-
-    _w_hour = {'ÉJFÉL': [(6, 3), (7, 3), (8, 3), (9, 3), (10, 3)],
-               'EGY': [(8, 5), (9, 5), (10, 5)],
-               'KETTŐ': [(6, 8), (7, 8), (8, 8), (9, 8), (10, 8)],
-               'HÁROM': [(5, 6), (6, 6), (7, 6), (8, 6), (9, 6)],
-               'NÉGY': [(1, 7), (2, 7), (3, 7), (4, 7)],
-               'ÖT': [(0, 8), (1, 8)],
-               'HAT': [(1, 5), (2, 5), (3, 5)],
-               'HÉT': [(4, 10), (5, 10), (6, 10)],
-               'NYOLC': [(6, 7), (7, 7), (8, 7), (9, 7), (10, 7)],
-               'KILENC': [(5, 9), (6, 9), (7, 9), (8, 9), (9, 9), (10, 9)],
-               'TÍZ': [(6, 10), (7, 10), (8, 10)],
-               'TIZENEGY': [(3, 5), (4, 5), (5, 5), (6, 5), (7, 5), (8, 5), (9, 5), (10, 5)],
-               'TIZENKETTŐ': [(1, 8), (2, 8), (3, 8), (4, 8), (5, 8), (6, 8), (7, 8), (8, 8), (9, 8), (10, 8)],
-               'DÉL': [(2, 9), (3, 9), (4, 9)]}
-
-    _hour2text = {0: "TIZENKETTŐ",
-                  1: "EGY",
-                  2: "KETTŐ",
-                  3: "HÁROM",
-                  4: "NÉGY",
-                  5: "ÖT",
-                  6: "HAT",
-                  7: "HÉT",
-                  8: "NYOLC",
-                  9: "KILENC",
-                  10: "TÍZ",
-                  11: "TIZENEGY",
-                  12: "TIZENKETTŐ",
-                  13: "EGY",
-                  14: "KETTŐ",
-                  15: "HÁROM",
-                  16: "NÉGY",
-                  17: "ÖT",
-                  18: "HAT",
-                  19: "HÉT",
-                  20: "NYOLC",
-                  21: "KILENC",
-                  22: "TÍZ",
-                  23: "TIZENEGY"}
-
-    def __init__(self, pin: int, ldr: LDR) -> None:
+    # size of the led matrix
+    _WIDTH = 11
+    _HEIGHT = 11
+
+    # compiled layout, see tools/layoutc.py: header, word state of every minute of the day, offsets of the word states
+    _LAYOUT_MAGIC = b"WCL1"
+    _LAYOUT_INDEX = 10
+    _MINUTES = 24 * 60
+
+    # uploaded frames: r, g, b of every led in rows from the upper left corner, each frame of an animation is
+    # prefixed by its duration (u16 ms, little endian)
+    _FRAME_BYTES = 11 * 11 * 3
+    _RECORD_BYTES = 2 + _FRAME_BYTES
+
+    def __init__(self, pin: int, ldr: LDR, clock=time.time) -> None:
+        """
+        :param pin: pin of the led strip
+        :param ldr: LDR measuring the ambient light
+        :param clock: returns the UTC (s) to display, e.g. NTPSync.time
+        """
+        self._clock = clock
+        self._config_version = 0
         self._strip = None
+        self._layers = None
         self._pin = pin
         self._flag = asyncio.ThreadSafeFlag()
         self._ldr = ldr
         self._config = None
         self.load()
+        self._tz = TZ(self.tz)
+
+        self._layout = None
+        self._alphabet = None
+        self._offsets = 0
+        self._positions = 0
+        self.load_layout(self._config['layout'])
+
+        # charge -> brightness table, see brightness_curve
+        self._curve = None
+        self._bucket_bounds = None
+        self._fg = None
+        self._bg = None
+        self.brightness_curve = (2, 16)
+
+        # LRU cache of packed frames: keys in order of use (most recent last), frames by key
+        self._frame_keys = []
+        self._frames = {}
+        self._frame_hits = 0
+        self._frame_misses = 0
+        self._frame_evictions = 0
+
+        # uploaded frames (see upload()), the task playing them, strip position of each led of an uploaded frame
+        self._upload = bytearray(self.upload_max)
+        self._player = None
+        self._xy2pos = bytes(self.xy2pos((i % 11, i // 11)) for i in range(11 * 11))
+        # player of the last animation, crossfade between displayed times (None if off)
+        self._animation = None
+        self._animations = 0
+        self._crossfade = None
+
+        # scheduler: (word state, brightness bucket) on display, forced redraw, statistics
+        self._displayed = None
+        self._force = False
+        # ms the display task ran, accumulated per wakeup: a ticks_diff over the whole uptime wraps after ~6 days
+        self._uptime = 0
+        self._ticked = None
+        self._wakeups = 0
+        self._renders = 0
 
     def load(self):
-        with open(self._WCLOCK_CONFIG) as f:
-            config = json.load(f)
-            self._config = {"tz_offset": int(config["tz_offset"]),
-                            "refresh_period": int(config["refresh_period"]),
-                            "charge2brightness": {int(key): [int(value[0]), int(value[1])] for key, value in
-                                                  config["charge2brightness"].items()}
-                            }
+        config = store.get(self._WCLOCK_CONFIG)
+        self._config = {"tz": str(config.get("tz", self._legacy_tz(int(config.get("tz_offset", 1))))),
+                        "refresh_period": int(config["refresh_period"]),
+                        "charge2brightness": {int(key): [int(value[0]), int(value[1])] for key, value in
+                                              config["charge2brightness"].items()},
+                        "frame_cache": int(config.get("frame_cache", 4096)),
+                        "layout": str(config.get("layout", "hu.wcl")),
+                        "upload_max": int(config.get("upload_max", 8192)),
+                        "fade_ms": int(config.get("fade_ms", 0)),
+                        "fade_fps": int(config.get("fade_fps", 25))
+                        }
+        self._config_version += 1
 
     def save(self):
-        config = {"tz_offset": self.tz_offset,
+        config = {"tz": self.tz,
                   "refresh_period": self.refresh_period,
                   "charge2brightness": {str(charge): [brightness[0], brightness[1]] for charge, brightness in
-                                        self.charge2brightness.items()}
+                                        self.charge2brightness.items()},
+                  "frame_cache": self.frame_cache,
+                  "layout": self._config['layout'],
+                  "upload_max": self.upload_max,
+                  "fade_ms": self.fade_ms,
+                  "fade_fps": self._config['fade_fps']
                   }
-        with open(self._WCLOCK_CONFIG, "w") as f:
-            json.dump(config, f)
+        store.set(self._WCLOCK_CONFIG, config)
+
+    @staticmethod
+    def _legacy_tz(tz_offset: int) -> str:
+        """
+        POSIX TZ of a whole hour offset with EU DST (switching at 01:00 UTC), the rule of the former tz_offset key.
+        """
+        return f"STD{-tz_offset}DST,M3.5.0/{1 + tz_offset},M10.5.0/{2 + tz_offset}"
+
+    def load_layout(self, file: str) -> None:
+        """
+        Read a layout compiled by tools/layoutc.py.
+
+        :param file: compiled layout
+        """
+        layout = bytearray(os.stat(file)[6])
+        with open(file, "rb") as f:
+            f.readinto(layout)
+        if layout[:4] != self._LAYOUT_MAGIC:
+            raise ValueError(f"invalid layout: {file}")
+        if (layout[4], layout[5]) != (self._WIDTH, self._HEIGHT):
+            raise ValueError(f"layout {file} is {layout[4]}x{layout[5]}, the display is {self._WIDTH}x{self._HEIGHT}")
+
+        self._layout = layout
+        n_states = self._u16(6)
+        self._offsets = self._LAYOUT_INDEX + 2 * self._MINUTES
+        self._positions = self._offsets + 2 * (n_states + 1)
+        alphabet = self._positions + self._u16(self._offsets + 2 * n_states)
+        self._alphabet = {chr(self._u16(alphabet + 3 * i)): layout[alphabet + 3 * i + 2] for i in range(self._u16(8))}
+
+    def _u16(self, offset: int) -> int:
+        return self._layout[offset] | self._layout[offset + 1] << 8
+
+    def _state(self, hour: int, minute: int) -> int:
+        """
+        Word state of a time of day.
+        """
+        return self._u16(self._LAYOUT_INDEX + 2 * (hour * 60 + minute))
+
+    def _leds(self, state: int) -> memoryview:
+        """
+        Strip positions of the words of a word state.
+        """
+        offset = self._offsets + 2 * state
+        return memoryview(self._layout)[self._positions + self._u16(offset):self._positions + self._u16(offset + 2)]
 
     @property
-    def tz_offset(self):
-        return self._config['tz_offset']
+    def tz(self) -> str:
+        """
+        POSIX TZ string of the local time, e.g. "CET-1CEST,M3.5.0,M10.5.0/3".
+        """
+        return self._config['tz']
+
+    @property
+    def tz_offset(self) -> int:
+        """
+        Current offset of the local time to UTC (s).
+        """
+        return self._tz.offset(self._clock())
 
     @property
     def refresh_period(self):
         return self._config['refresh_period']
 
+    @property
+    def upload_max(self):
+        """
+        Size of the upload buffer, the largest upload accepted (bytes).
+        """
+        return self._config['upload_max']
+
+    @property
+    def fade_ms(self):
+        """
+        Duration of the crossfade between displayed times (ms), 0 switches at once.
+        """
+        return self._config['fade_ms']
+
+    @property
+    def frame_cache(self):
+        """
+        Memory cap of the frame cache (bytes).
+        """
+        return self._config['frame_cache']
+
+    @property
+    def frame_cache_stats(self) -> tuple[int, int, int]:
+        """
+        Hits, misses and evictions of the frame cache.
+        """
+        return self._frame_hits, self._frame_misses, self._frame_evictions
+
     @property
     def charge2brightness(self) -> dict[int, tuple[int, int]]:
         return self._config['charge2brightness']
@@ -173,6 +248,7 @@ class WClock:
     def charge2brightness(self, ch2br: dict[int, tuple[int, int]]):
         assert True  # TODO: implement check
         self._config['charge2brightness'] = ch2br
+        self._config_version += 1
         print(f"Update charge2brightness: {self._config['charge2brightness']}")
         self.save()
 
@@ -203,53 +279,209 @@ class WClock:
         return brightness_max - int(math.log(charge, charge_max) * (brightness_max - 2))
 
     @staticmethod
-    def _ch2br(charge: float) -> int:
-        chargemax = 1000000
+    def _ch2br(charge: float, shape: float = 2) -> int:
+        chargemax = WClock._CHARGE_MAX
         brightnessmax = 255
         if charge is None or charge < 1:
             return 255
         elif charge > chargemax:
             return 2
 
-        return WClock._circle(charge, 2, chargemax, brightnessmax)
+        return WClock._circle(charge, shape, chargemax, brightnessmax)
         # return WClock._log(charge, chargemax, brightnessmax)
 
+    @property
+    def brightness_curve(self) -> tuple[float, int]:
+        """
+        Shape of the charge -> brightness curve and number of charge buckets per decade.
+        """
+        return self._curve
+
+    @brightness_curve.setter
+    def brightness_curve(self, curve: tuple[float, int]):
+        if curve == self._curve:
+            return
+        shape, per_decade = curve
+        n = round(math.log10(self._CHARGE_MAX)) * per_decade
+        # bucket 0: no (or below 1us) charge, bucket i: charge in [bounds[i - 1], bounds[i]), n + 1: above max
+        self._bucket_bounds = array.array('I', [round(10 ** (i / per_decade)) for i in range(n + 1)])
+        self._fg = bytearray(n + 2)
+        self._fg[0] = self._ch2br(None)
+        for i in range(1, n + 1):
+            # geometric center of the bucket
+            self._fg[i] = self._ch2br(10 ** ((i - 0.5) / per_decade), shape)
+        self._fg[n + 1] = self._ch2br(self._CHARGE_MAX + 1)
+        self._bg = bytearray(int(fg * 0.10) for fg in self._fg)
+        self._curve = curve
+        self._config_version += 1
+
+        # cached frames were rendered with the old curve
+        self._frame_keys = []
+        self._frames = {}
+
+    def _bucket(self, charge: int | None) -> int:
+        """
+        Bucket of a charge time, see brightness_curve.
+        """
+        if charge is None or charge < 1:
+            return 0
+        bounds = self._bucket_bounds
+        lo = 0
+        hi = len(bounds)
+        # number of bounds not above charge
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if bounds[mid] <= charge:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    @property
+    def brightness_bucket(self) -> int:
+        """
+        Brightness bucket of the current LDR charge. Read it once per frame, so all pixels see the same brightness.
+        """
+        return self._bucket(self._ldr.charge)
+
     @property
     def brightness(self) -> tuple[int, int]:
+        bucket = self._bucket(self._ldr.charge)
+        return self._fg[bucket], self._bg[bucket]
+
+    @property
+    def strip(self) -> Neopixel | None:
+        """
+        Led strip, None while the display task is not running.
+        """
+        return self._strip
+
+    @property
+    def frames(self) -> tuple[int, int]:
+        """
+        Number of frames sent to and skipped (unchanged) by the strip.
+        """
+        if self._strip is None:
+            return 0, 0
+        return self._strip.frames_sent, self._strip.frames_skipped
 
-        charge = self._ldr.charge
-        return self._ch2br(charge), int(self._ch2br(charge) * 0.10)
+    @property
+    def version(self) -> int:
+        """
+        Changes whenever the config or any of the statistics changes, e.g. to tell if a rendered page is stale: the
+        sum of counters that only grow.
+        """
+        sent, skipped = self.frames
+        hits, misses, evictions = self.frame_cache_stats
+        fps, fade_frames, fade_misses = self.fade_stats
+        return (self._config_version + sent + skipped + hits + misses + evictions + self._wakeups + self._renders +
+                fade_frames + fade_misses + self._animations)
+
+    @property
+    def animation_stats(self) -> tuple[float, int, int]:
+        """
+        Achieved frames per second, dropped frames and worst lateness (ms) of the last animation.
+        """
+        if self._animation is None:
+            return 0.0, 0, 0
+        return self._animation.achieved_fps, self._animation.dropped, self._animation.worst_late
+
+    @property
+    def fade_stats(self) -> tuple[int, int, int]:
+        """
+        Current frame rate of the crossfade, frames shown and frames that missed their deadline.
+        """
+        if self._crossfade is None:
+            return 0, 0, 0
+        return self._crossfade.fps, self._crossfade.frames, self._crossfade.misses
+
+    @property
+    def scheduler_stats(self) -> tuple[int, int, float]:
+        """
+        Wakeups and renders of the display task, and wakeups per hour since start.
+        """
+        if self._ticked is None:
+            return self._wakeups, self._renders, 0.0
+        uptime = (self._uptime + time.ticks_diff(time.ticks_ms(), self._ticked)) / 3600000
+        return self._wakeups, self._renders, round(self._wakeups / uptime, 1) if uptime > 0 else 0.0
+
+    def refresh(self) -> None:
+        """
+        Redraw the display now.
+        """
+        self._force = True
+        self._flag.set()
+
+    def _on_charge(self, charge: int) -> None:
+        # wake the display task only if the brightness changes
+        if self._displayed is not None and self._bucket(charge) != self._displayed[1]:
+            self._flag.set()
+
+    def _key(self) -> tuple[int, int]:
+        """
+        Word state and brightness bucket of the current frame.
+        """
+        d, d, d, d, hour, minute, d, d = self._tz.localtime(self._clock())
+        return self._state(hour, minute), self.brightness_bucket
+
+    def _next_wakeup(self) -> int:
+        """
+        Milliseconds until the next minute, DST transition or at most refresh period.
+        """
+        utc = self._clock()
+        d, d, d, d, hour, minute, second, d = self._tz.localtime(utc)
+        seconds = min(60 - second, self._tz.next_transition(utc) - utc, self.refresh_period)
+        return max(seconds, 1) * 1000
 
     async def start(self):
         self._strip = Neopixel(11 * 11, 1, self._pin, "GRB")
+        self._layers = Compositor(self._strip)
+        self._layers.add("background", opaque=True)
+        self._layers.add("time")
+        overlay = self._layers.add("overlay", opaque=True)
+        overlay.visible = False
+        if self.fade_ms > 0:
+            self._crossfade = Crossfade(self._strip, self.fade_ms, self._config['fade_fps'])
         await self.colorwave(1)
+        self._ldr.subscribe(self._on_charge)
+        self._ticked = time.ticks_ms()
         try:
-            timer = Timer(period=self.refresh_period * 1000, mode=Timer.PERIODIC, callback=self._tick)
             while True:
+                self._wakeups += 1
+                now = time.ticks_ms()
+                self._uptime += time.ticks_diff(now, self._ticked)
+                self._ticked = now
                 try:
-                    print("Display...", end='')
-                    await self.timecolor()
-                    print(f"OK {self.brightness}")
+                    with _tick:
+                        if self._force or self._key() != self._displayed:
+                            self._force = False
+                            print("Display...", end='')
+                            await self.timecolor()
+                            self._renders += 1
+                            print(f"OK {self.brightness}")
                 except asyncio.CancelledError:
                     raise
                 except Exception as e:
                     sys.print_exception(e)
 
-                await self._flag.wait()
+                try:
+                    await asyncio.wait_for_ms(self._flag.wait(), self._next_wakeup())
+                except asyncio.TimeoutError:
+                    pass
         except asyncio.CancelledError:
             pass
         finally:
-            timer.deinit()
+            self._ldr.unsubscribe(self._on_charge)
+            await self.stop_animation()
             self._strip.clear()
             self._strip = None
+            self._layers = None
 
-    def _tick(self, t: Timer):
-        self._flag.set()
-
-    async def colorwave(self, n: int = 1) -> None:
+    async def colorwave(self, n: int = 1, fps: int = 24) -> None:
         """
-        Color wave animation
+        Color wave animation, played at a fixed rate
         :param n: number of waves
+        :param fps: frames per second
         """
         colors_rgb = [self._red, self._orange, self._yellow, self._green, self._blue, self._indigo, self._violet]
 
@@ -265,18 +497,24 @@ class WClock:
 
         self._strip.set_pixel_line_gradient(current_pixel, 11 * 11 - 1, self._violet, self._red)
 
-        for i in range(n * self._strip.num_leds):
-            self._strip.rotate_right(1)
-            await asyncio.sleep(0.042)
-            self._strip.show()
+        # every frame is the gradient rotated right by one more pixel, only the rotation offset changes
+        strip = self._strip
+        num_leds = strip.num_leds
+
+        def frame(i: int) -> None:
+            strip.offset = -(i + 1) % num_leds
 
-    def szia(self, names: list[str]) -> None:
+        self._animation = Player(strip, fps)
+        await self._animation.play(n * num_leds, frame)
+        self._animations += 1
+
+    async def szia(self, names: list[str]) -> None:
         """
         Greetings
         :param names: list of names, from which one is chosen randomly
         :return:
         """
-        self.print(f"Szia {names[random.randint(0, len(names) - 1)]}", (255, 255, 255))
+        await self.print(f"Szia {names[random.randint(0, len(names) - 1)]}", (255, 255, 255))
 
     def set_pixel(self, xy: tuple[int, int], rgb_w: tuple[int, int, int], how_bright=None) -> None:
         """
@@ -292,17 +530,183 @@ class WClock:
         :param freq: flashing frequency (Hz)
         :return:
         """
-        for c in text.upper():
-            self._strip.clear()
-            if c == ' ':
-                pass
+        overlay = self._layers["overlay"]
+        value = self._strip.pack(color)
+        overlay.visible = True
+        try:
+            for c in text.upper():
+                overlay.clear()
+                if c == ' ':
+                    pass
+                else:
+                    overlay.pixels[self._alphabet[c]] = value
+                self._layers.compose()
+                await self._strip.show_async()
+                await asyncio.sleep(1 / freq)
+        finally:
+            overlay.visible = False
+            overlay.clear()
+            # back to the time, the display task redraws it
+            self.refresh()
+
+    async def upload(self, stream, length: int, ms: int = 10000) -> int:
+        """
+        Read frames (see _FRAME_BYTES) from a stream straight into the upload buffer and play them over the time
+        display in the background. A running animation is stopped.
+
+        :param stream: asyncio stream of the frames, e.g. a request body
+        :param length: bytes to read: a single frame or animation records
+        :param ms: how long a single frame is shown
+        :return: number of frames
+        """
+        if self._strip is None:
+            raise ValueError("display is not running")
+        if length > len(self._upload):
+            raise ValueError(f"upload too large: {length} > {len(self._upload)} bytes")
+        if length == self._FRAME_BYTES:
+            n = 1
+        elif length > 0 and length % self._RECORD_BYTES == 0:
+            n = length // self._RECORD_BYTES
+        else:
+            raise ValueError(f"invalid length: {length}, expected {self._FRAME_BYTES} or a multiple of "
+                             f"{self._RECORD_BYTES} bytes")
+
+        await self.stop_animation()
+        if await self._readinto(stream, memoryview(self._upload)[:length]) < length:
+            raise ValueError("upload truncated")
+        self._player = asyncio.create_task(self._play(length, ms))
+        return n
+
+    async def stop_animation(self) -> None:
+        """
+        Stop playing uploaded frames, the time is displayed again.
+        """
+        if self._player is not None:
+            self._player.cancel()
+            await self._player
+            self._player = None
+
+    @staticmethod
+    async def _readinto(stream, buf: memoryview) -> int:
+        """
+        Fill <buf> from a stream, without allocating if the stream supports readinto.
+        """
+        n = 0
+        while n < len(buf):
+            if hasattr(stream, "readinto"):
+                k = await stream.readinto(buf[n:])
             else:
-                pos = self.xy2pos(self._alphabet[c])
-                self._strip.set_pixel(pos, color)
-            self._strip.show()
-            await asyncio.sleep(1 / freq)
+                chunk = await stream.read(len(buf) - n)
+                k = len(chunk)
+                buf[n:n + k] = chunk
+            if not k:
+                break
+            n += k
+        return n
+
+    async def _play(self, length: int, ms: int) -> None:
+        overlay = self._layers["overlay"]
+        overlay.visible = True
+        try:
+            frames, ends = self._compile_upload(length, ms)
+            self._animation = Player(self._strip)
+            await self._animation.play_frames(frames, ends.__getitem__)
+            self._animations += 1
+        except asyncio.CancelledError:
+            pass
+        finally:
+            overlay.visible = False
+            overlay.clear()
+            # back to the time, the display task redraws it
+            self.refresh()
 
+    def _compile_upload(self, length: int, ms: int) -> tuple[list, array.array]:
+        """
+        Pack the uploaded frames at the current foreground brightness, in strip order, before playing them.
+
+        :return: frames, and the time each frame is due (ms since the start) followed by the end of the last one
+        """
+        strip = self._strip
+        lut = strip.lut(self.brightness[0])
+        sh_r, sh_g, sh_b, sh_w = strip.shift
+        upload = self._upload
+        xy2pos = self._xy2pos
+        if length == self._FRAME_BYTES:
+            records = ((0, ms),)
+        else:
+            records = [(offset + 2, upload[offset] | upload[offset + 1] << 8)
+                       for offset in range(0, length, self._RECORD_BYTES)]
+        frames = []
+        ends = array.array('I', [0] * (len(records) + 1))
+        for n, (offset, duration) in enumerate(records):
+            pixels = array.array('I', [0] * strip.num_leds)
+            for i in range(len(xy2pos)):
+                j = offset + 3 * i
+                pixels[xy2pos[i]] = lut[upload[j]] << sh_r | lut[upload[j + 1]] << sh_g | lut[upload[j + 2]] << sh_b
+            frames.append(pixels)
+            ends[n + 1] = ends[n] + duration
+        return frames, ends
+
+    @trace.traced("timecolor", "wclock")
     async def timecolor(self) -> None:
+        """
+        Display current time over the rainbow background. Rendered frames are cached per word state and brightness
+        bucket.
+        :return:
+        """
+        start = time.ticks_us()
+        key = self._key()
+        state, bucket = key
+        fg = self._fg[bucket]
+        bg = self._bg[bucket]
+        self._displayed = key
+
+        overlay = self._layers["overlay"]
+        if overlay.visible:
+            # text or animation on top covers the time, it is redrawn when the overlay is hidden (see refresh())
+            return
+        frame = self._frames.get(key)
+        if frame is not None:
+            self._frame_hits += 1
+            self._frame_keys.remove(key)
+            self._frame_keys.append(key)
+            self._strip.load(frame)
+        else:
+            self._frame_misses += 1
+            self._background(bg)
+            self._words(state, fg)
+            self._layers.compose()
+            self._cache_frame(key)
+        _frames_rendered.inc()
+        _render_time.observe(time.ticks_diff(time.ticks_us(), start))
+
+        strip = self._strip
+        # nothing to fade if the frame did not change (e.g. a brightness wakeup within the same bucket)
+        if self._crossfade is not None and strip.frames_sent > 0 and strip.pixels != strip.front:
+            await self._crossfade.fade(lambda: overlay.visible)
+        else:
+            await strip.show_async()
+
+    def _cache_frame(self, key: tuple[int, int]) -> None:
+        """
+        Store a copy of the strip as frame <key>, evict least recently used frames above the memory cap.
+        """
+        size = self._strip.num_leds * self._strip.pixels.itemsize
+        while self._frame_keys and (len(self._frame_keys) + 1) * size > self.frame_cache:
+            del self._frames[self._frame_keys.pop(0)]
+            self._frame_evictions += 1
+        if size <= self.frame_cache:
+            self._frames[key] = array.array('I', self._strip.pixels)
+            self._frame_keys.append(key)
+
+    def _background(self, bg: int) -> None:
+        """
+        Rasterize the rainbow background layer, if the brightness changed.
+        """
+        layer = self._layers["background"]
+        if layer.key == bg:
+            return
+
         colors_rgb = [self._red, self._orange, self._yellow, self._green, self._blue, self._indigo, self._violet]
 
         colors = colors_rgb
@@ -311,89 +715,34 @@ class WClock:
         current_pixel = 0
 
         for color1, color2 in zip(colors, colors[1:]):
-            self._strip.set_pixel_line_gradient(current_pixel, current_pixel + step, color1, color2, self.brightness[1])
+            layer.gradient(self._strip, current_pixel, current_pixel + step, color1, color2, bg)
             current_pixel += step
-        self._strip.set_pixel_line_gradient(current_pixel, 11 * 11 - 1, self._violet, self._red, self.brightness[1])
-
-        await self.time()
+        layer.gradient(self._strip, current_pixel, 11 * 11 - 1, self._violet, self._red, bg)
+        layer.key = bg
 
+    def _words(self, state: int, fg: int) -> None:
+        """
+        Rasterize the time layer with the words of a word state, if the state or the brightness changed.
+        """
+        layer = self._layers["time"]
+        if layer.key == (state, fg):
+            return
+
+        pixels = layer.pixels
+        value = self._strip.pack((100, 100, 100), fg)
+        layer.lit = self._leds(state)
+        for pos in layer.lit:
+            pixels[pos] = value
+        layer.key = (state, fg)
+
+    @trace.traced("time", "wclock")
     async def time(self) -> None:
         """
         Display current time.
         :return:
         """
-        d, d, d, d, hour, minute, d, d = NTPSync.localTime(self.tz_offset)
-
-        text = []
-
-        if minute == 0:
-            text = []
-        elif minute == 1:
-            text = [self._w_before['EGY'], self._w_unit['PERCCEL MÚLT']]
-        elif minute == 2:
-            text = [self._w_before['KÉT'], self._w_unit['PERCCEL MÚLT']]
-        elif 3 <= minute <= 7:
-            text = [self._w_before['ÖT'], self._w_unit['PERCCEL MÚLT']]
-        elif 8 <= minute <= 12:
-            text = [self._w_before['TÍZ'], self._w_unit['PERCCEL MÚLT']]
-        elif minute == 13:
-            text = [self._w_before['KÉT'], self._w_unit['PERC MÚLVA'], self._w_part['NEGYED']]
-        elif minute == 14:
-            text = [self._w_before['EGY'], self._w_unit['PERC MÚLVA'], self._w_part['NEGYED']]
-        elif minute == 15:
-            text = [self._w_part['NEGYED']]
-        elif minute == 16:
-            text = [self._w_before['EGY'], self._w_unit['PERCCEL MÚLT'], self._w_part['NEGYED']]
-        elif minute == 17:
-            text = [self._w_before['KÉT'], self._w_unit['PERCCEL MÚLT'], self._w_part['NEGYED']]
-        elif 18 <= minute <= 15 + 7:
-            text = [self._w_before['ÖT'], self._w_unit['PERCCEL MÚLT'], self._w_part['NEGYED']]
-        elif 15 + 8 <= minute <= 27:
-            text = [self._w_before['ÖT'], self._w_unit['PERC MÚLVA'], self._w_part['FÉL']]
-        elif minute == 28:
-            text = [self._w_before['KÉT'], self._w_unit['PERC MÚLVA'], self._w_part['FÉL']]
-        elif minute == 29:
-            text = [self._w_before['EGY'], self._w_unit['PERC MÚLVA'], self._w_part['FÉL']]
-        elif minute == 30:
-            text = [self._w_part['FÉL']]
-        elif minute == 31:
-            text = [self._w_before['EGY'], self._w_unit['PERCCEL MÚLT'], self._w_part['FÉL']]
-        elif minute == 32:
-            text = [self._w_before['KÉT'], self._w_unit['PERCCEL MÚLT'], self._w_part['FÉL']]
-        elif 33 <= minute <= 30 + 7:
-            text = [self._w_before['ÖT'], self._w_unit['PERCCEL MÚLT'], self._w_part['FÉL']]
-        elif 30 + 8 <= minute <= 42:
-            text = [self._w_before['ÖT'], self._w_unit['PERC MÚLVA'], self._w_part['HÁROMNEGYED']]
-        elif minute == 43:
-            text = [self._w_before['KÉT'], self._w_unit['PERC MÚLVA'], self._w_part['HÁROMNEGYED']]
-        elif minute == 44:
-            text = [self._w_before['EGY'], self._w_unit['PERC MÚLVA'], self._w_part['HÁROMNEGYED']]
-        elif minute == 45:
-            text = [self._w_part['HÁROMNEGYED']]
-        elif minute == 46:
-            text = [self._w_before['EGY'], self._w_unit['PERCCEL MÚLT'], self._w_part['HÁROMNEGYED']]
-        elif minute == 47:
-            text = [self._w_before['KÉT'], self._w_unit['PERCCEL MÚLT'], self._w_part['HÁROMNEGYED']]
-        elif 48 <= minute <= 45 + 7:
-            text = [self._w_before['TÍZ'], self._w_unit['PERC MÚLVA']]
-        elif 45 + 8 <= minute <= 57:
-            text = [self._w_before['ÖT'], self._w_unit['PERC MÚLVA']]
-        elif minute == 58:
-            text = [self._w_before['KÉT'], self._w_unit['PERC MÚLVA']]
-        elif minute == 59:
-            text = [self._w_before['EGY'], self._w_unit['PERC MÚLVA']]
-
-        if hour == 0 and minute <= 12 or hour == 23 and minute >= 48:
-            text.append(self._w_hour["ÉJFÉL"])
-        elif hour == 12 and minute <= 12 or hour == 11 and minute >= 48:
-            text.append(self._w_hour["DÉL"])
-        else:
-            if minute <= 12:
-                text.append(self._w_hour[self._hour2text[hour]])
-            elif minute >= 13:
-                text.append(self._w_hour[self._hour2text[(hour + 1) % 24]])
-
-        for xys in text:
-            for xy in xys:
-                self.set_pixel(xy, (100, 100, 100), self.brightness[0])
-        self._strip.show()
+        d, d, d, d, hour, minute, d, d = self._tz.localtime(self._clock())
+
+        self._words(self._state(hour, minute), self.brightness[0])
+        self._layers.compose()
+        await self._strip.show_async()
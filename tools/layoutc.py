@@ -0,0 +1,116 @@
+"""
+Offline compiler of word clock layouts (runs on the host, not on the device).
+
+    python tools/layoutc.py layouts/hu.json src/hu.wcl
+
+A layout (json) describes the letter grid of the faceplate and the rules to tell the time with it:
+
+    width, height   size of the grid, leds are wired in a serpentine from the lower right corner (see WClock.xy2pos)
+    grid            rows of letters, "." for a letter not used by any word (documentation and validation only)
+    alphabet        letter -> [x, y], used to print text letter by letter
+    words           name -> list of [x, y, length] horizontal runs, the letters after the "." of the name (without
+                    spaces) must match the grid
+    minutes         [first, last, [word, ...]] for every minute of the hour
+    next_hour_from  from this minute on, the hour word refers to the next hour
+    hours           hour word for each of the 24 hours
+    special         [hour, first minute, last minute, word] replacing the hour word (e.g. noon and midnight)
+
+The compiled blob (little endian) contains the strip positions of every distinct word state and an index from
+hour * 60 + minute to its word state, so the clock can show the time without evaluating any rules:
+
+    0   b"WCL1"
+    4   u8 width, u8 height
+    6   u16 number of word states (n)
+    8   u16 number of alphabet letters (m)
+    10  u16[1440] word state of hour * 60 + minute
+        u16[n + 1] offset of the positions of each word state, relative to the first position
+        u8[] strip positions of the word states
+        m * (u16 unicode code point, u8 strip position) alphabet
+"""
+import json
+import struct
+import sys
+
+MAGIC = b"WCL1"
+
+
+def xy2pos(x: int, y: int, width: int, height: int) -> int:
+    if not (0 <= x < width and 0 <= y < height):
+        raise ValueError(f"invalid position: {x}, {y}")
+    if y % 2 == 0:
+        return (height - 1 - y) * width + width - 1 - x
+    else:
+        return (height - 1 - y) * width + x
+
+
+def word_positions(layout: dict, name: str) -> list[int]:
+    width = layout["width"]
+    height = layout["height"]
+    grid = layout["grid"]
+    letters = name.split(".", 1)[-1].replace(" ", "")
+    xys = [(x + i, y) for x, y, length in layout["words"][name] for i in range(length)]
+    if len(xys) != len(letters):
+        raise ValueError(f"word {name!r} has {len(letters)} letters, but {len(xys)} positions")
+    for letter, (x, y) in zip(letters, xys):
+        if grid[y][x] not in (".", letter):
+            raise ValueError(f"word {name!r}: {letter!r} expected at {x}, {y}, grid has {grid[y][x]!r}")
+    return [xy2pos(x, y, width, height) for x, y in xys]
+
+
+def compile_layout(layout: dict) -> bytes:
+    width = layout["width"]
+    height = layout["height"]
+    if width * height > 256:
+        raise ValueError("strip positions must fit in a byte")
+    if len(layout["grid"]) != height or any(len(row) != width for row in layout["grid"]):
+        raise ValueError(f"grid must be {width}x{height}")
+
+    minute_words = [None] * 60
+    for first, last, words in layout["minutes"]:
+        for minute in range(first, last + 1):
+            if minute_words[minute] is not None:
+                raise ValueError(f"minute {minute} has more rules")
+            minute_words[minute] = words
+    if None in minute_words:
+        raise ValueError(f"minute {minute_words.index(None)} has no rule")
+    if len(layout["hours"]) != 24:
+        raise ValueError("hours must have 24 words")
+
+    special = {}
+    for hour, first, last, word in layout["special"]:
+        for minute in range(first, last + 1):
+            special[hour * 60 + minute] = word
+
+    states = {}
+    index = []
+    for hour in range(24):
+        for minute in range(60):
+            hour_word = special.get(hour * 60 + minute)
+            if hour_word is None:
+                hour_word = layout["hours"][(hour + (minute >= layout["next_hour_from"])) % 24]
+            positions = bytes(pos for word in minute_words[minute] + [hour_word]
+                              for pos in word_positions(layout, word))
+            index.append(states.setdefault(positions, len(states)))
+
+    offsets = [0]
+    for positions in states:
+        offsets.append(offsets[-1] + len(positions))
+
+    alphabet = b"".join(struct.pack("<HB", ord(letter), xy2pos(x, y, width, height))
+                        for letter, (x, y) in layout["alphabet"].items())
+
+    return (MAGIC + struct.pack("<BBHH", width, height, len(states), len(layout["alphabet"])) +
+            struct.pack(f"<{len(index)}H", *index) + struct.pack(f"<{len(offsets)}H", *offsets) +
+            b"".join(states) + alphabet)
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print(f"usage: {sys.argv[0]} <layout.json> <output.wcl>")
+        sys.exit(1)
+
+    with open(sys.argv[1], encoding="utf-8") as f:
+        blob = compile_layout(json.load(f))
+    with open(sys.argv[2], "wb") as f:
+        f.write(blob)
+    print(f"{sys.argv[2]}: {len(blob)} bytes")